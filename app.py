@@ -14,52 +14,133 @@ import os
 import logging
 import requests
 import base64
+import hashlib
+import hmac
+import json
+import queue
 import time
 import signal
 import sys
 import string
+import sqlite3
+import threading
 from datetime import datetime
 from pathlib import Path
-from flask import Flask, jsonify, render_template
-from lib.tickets import get_all_tickets, make_status_priority_readable, sort_tickets
+from flask import Flask, Response, jsonify, render_template, request, stream_with_context
+from flask.json.provider import DefaultJSONProvider
+from lib.tickets import OPEN_STATUSES, iter_scored_tickets, get_updated_tickets, make_status_priority_readable, score_tickets
+from lib.snapshot import TicketSnapshot
+from lib.shared_snapshot import SharedTicketSnapshot, DEFAULT_POLL_INTERVAL
+from lib.reference_cache import ReferenceCache
+from lib.sync import TicketSync
+from lib.summary import QueueSummary
+from lib.export import EXPORT_CONTENT_TYPES, EXPORT_FORMATS, DEFAULT_CHUNK_SIZE, check_export_format, export_chunks, iter_chunks, iter_sorted_chunks, parse_status_scope
+from lib.deadlines import DeadlineScheduler
+from lib.records import TicketRecord, json_default
+from lib.bodies import choose_encoding, response_body
+from lib import metrics
+from lib.logs import configure_logging
+from lib.profiling import RefreshProfiler, DEFAULT_TOP as DEFAULT_PROFILE_TOP
+from lib.store import TicketStore
+from lib.query import TicketIndex, QueryError, parse_ticket_query, run_ticket_query
+from lib.transport import configure_transport, make_api_request, get_json, DEFAULT_POOL_SIZE, DEFAULT_CONNECT_TIMEOUT, DEFAULT_READ_TIMEOUT
+from lib.scheduler import configure_scheduler, get_scheduler, DEFAULT_WORKERS
+from lib.fake_freshservice import DEFAULT_PORT as FAKE_FRESHSERVICE_PORT
+
+# JSON provider that serializes ticket records like the dicts they replaced
+class TicketJSONProvider(DefaultJSONProvider):
+    @staticmethod
+    def default(value):
+        if isinstance(value, TicketRecord):
+            return value.to_dict()
+        return DefaultJSONProvider.default(value)
 
 # Flask app initialization
 app = Flask(__name__)
+app.json = TicketJSONProvider(app)
 
 # Script Variables:
 SCRIPT_NAME = 'app.py'
 SCRIPT_VERSION = '1.0.3'  # Update with each release.
 
 # Global variables for tracking
-original_time_wait = None
 interrupted = False
+ticket_snapshot = None
+app_args = None
+ticket_snapshot_lock = threading.Lock()
+export_lock = threading.Lock()
+reference_cache = None
+ticket_sync = None
+deadline_scheduler = None
+ticket_store = None
+refresh_profiler = None
+auth_header = None
+
+# Function used as an argparse type for options that must be 1 or more
+def positive_int(value):
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"must be 1 or more, got {value}")
+    return number
 
 # Argument Parsing
-def parse_arguments():
+def parse_arguments(argv=None):
     parser = argparse.ArgumentParser(description='Script to read and sort FreshService tickets.\n')
-    parser.add_argument('-m', '--mode', default='production', choices=['staging', 'production', 'test'], help='API mode: staging, production, or test.')
+    parser.add_argument('-m', '--mode', default='production', choices=['staging', 'production', 'test'], help='API mode: staging, production, or test (local fake FreshService server).')
     parser.add_argument('-t', '--time-wait', type=int, default=200, help='Time in milliseconds to wait between API calls.')
+    parser.add_argument('-w', '--workers', type=positive_int, default=DEFAULT_WORKERS, help='Number of API requests allowed in flight at once.')
     parser.add_argument('-l', '--log-level', choices=['INFO', 'WARNING', 'DEBUG'], default='INFO', help='Logging level')
-    return parser.parse_args()
+    parser.add_argument('-r', '--refresh-interval', type=int, default=300, help='Seconds between background ticket refreshes.')
+    parser.add_argument('-s', '--sync-mode', default='incremental', choices=['incremental', 'full'], help='Fetch only tickets updated since the last refresh, or every open ticket on every refresh.')
+    parser.add_argument('--full-sync-interval', type=int, default=3600, help='Seconds between full reconciles when using incremental sync.')
+    parser.add_argument('--pool-size', type=int, default=DEFAULT_POOL_SIZE, help='Number of keep-alive connections kept open to FreshService.')
+    parser.add_argument('--connect-timeout', type=float, default=DEFAULT_CONNECT_TIMEOUT, help='Seconds to wait for a connection to FreshService.')
+    parser.add_argument('--read-timeout', type=float, default=DEFAULT_READ_TIMEOUT, help='Seconds to wait for a FreshService response.')
+    parser.add_argument('--base-url', help='FreshService URL to use instead of the one for the selected mode, e.g. http://127.0.0.1:8100')
+    parser.add_argument('-p', '--port', type=int, default=5000, help='Port the dashboard listens on.')
+    parser.add_argument('--shared-snapshot', help='Snapshot file shared by several worker processes. One worker crawls FreshService and the others serve its snapshot.')
+    parser.add_argument('--poll-interval', type=float, default=DEFAULT_POLL_INTERVAL, help='Seconds between checks for a new shared snapshot in workers that do not crawl.')
+    parser.add_argument('--export', metavar='PATH', help='Export the prioritized tickets to this file (- for standard output) and exit, without starting the dashboard.')
+    parser.add_argument('--export-format', choices=EXPORT_FORMATS, help='Export format. Defaults to the file extension, or csv.')
+    parser.add_argument('--export-scope', default='open', help='Ticket statuses to export: open, all, or a comma separated list of status names or numbers.')
+    parser.add_argument('--export-chunk-size', type=int, default=DEFAULT_CHUNK_SIZE, help='Tickets per CSV chunk or Parquet row group.')
+    parser.add_argument('--profile', action='store_true', help='Profile every ticket refresh and save the profiles to the logs/profiles folder.')
+    parser.add_argument('--profile-token', help=f'Secret that lets a /tickets request ask for a profiled refresh with the {PROFILE_HEADER} header.')
+    parser.add_argument('--profile-top', type=int, default=DEFAULT_PROFILE_TOP, help='Number of functions listed in the log after each profile.')
+    return parser.parse_args(argv)
 
 # Environment variables
 ## Old method being replaced.
 #API_KEY = input("Enter your API key: ")
-## New method
-print(f"Enter your API Key: ")
-API_KEY = sys.stdin.readline().rstrip('\n');
+## New method. WSGI servers have no terminal to type into, so FSC_API_KEY is used when it is set.
+API_KEY = os.environ.get('FSC_API_KEY')
+if not API_KEY:
+    # The prompt goes to stderr so it never ends up in an export written to stdout (--export -)
+    print("Enter your API Key: ", file=sys.stderr)
+    API_KEY = sys.stdin.readline().rstrip('\n');
 
 FRESH_SERVICE_ENDPOINTS = {
-    'staging': 'cbportal-fs-sandbox',
-    'production': 'cbportal',
+    'staging': 'https://cbportal-fs-sandbox.freshservice.com',
+    'production': 'https://cbportal.freshservice.com',
+    # Local stand-in server, see lib/fake_freshservice.py
+    'test': f'http://127.0.0.1:{FAKE_FRESHSERVICE_PORT}',
 }
 LOG_DIRECTORY = './logs/'
+STREAM_CHUNK_SIZE = 100  # Tickets per chunk in the NDJSON /tickets response
+STREAM_HEARTBEAT = 15  # Seconds between keep-alive comments on /tickets/stream
+PROFILE_HEADER = 'X-FSC-Profile-Token'  # Request header that asks /tickets for a profiled refresh
+CACHE_DIRECTORY = './cache/'
+PROFILE_DIRECTORY = './logs/profiles/'
+
+# Seconds before each reference directory is crawled again in full
+REFERENCE_TTLS = {
+    'departments': 24 * 60 * 60,
+    'agents': 4 * 60 * 60,
+    'groups': 24 * 60 * 60,
+}
 
-# Logging Configuration with Iteration
-def setup_logging(args):
-    today = datetime.now().strftime("%Y-%m-%d")
-    input_filename = SCRIPT_NAME
-
+# Logging configuration. Records are written by a listener thread, so logging never waits on the disk.
+def setup_logging(args, log_name=None, console_stream=None):
     # Convert the relative log directory path to an absolute path
     log_directory = Path(LOG_DIRECTORY).resolve()
 
@@ -67,27 +148,18 @@ def setup_logging(args):
     if not log_directory.exists():
         log_directory.mkdir(parents=True, exist_ok=True)
 
-    iteration = 1
-    while True:
-        log_filename = f"{today}-{input_filename}_{iteration}.log"
-        full_log_path = log_directory / log_filename
-        if not full_log_path.exists():
-            break
-        iteration += 1
-
-    # Set the baseline logging level to INFO
-    logging.basicConfig(filename=str(full_log_path), filemode='w',  # 'w' to write from the beginning
-                        level=logging.INFO,
-                        format='%(asctime)s - %(levelname)s - %(message)s')
+    # One file per process, rotated by size and at midnight instead of a new numbered file per run
+    full_log_path = log_directory / (log_name or f"{SCRIPT_NAME}.log")
+    configure_logging(full_log_path, logging.INFO, console_stream=console_stream)
 
     # Start logging with script details
     logging.info('#' * 50)
-    logging.info(f"Script Name: {SCRIPT_NAME}")
-    logging.info(f"Script Start Time: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+    logging.info("Script Name: %s", SCRIPT_NAME)
+    logging.info("Script Start Time: %s", datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
 
     # Log the input parameters
     for arg in vars(args):
-        logging.info(f"{arg}: {getattr(args, arg)}")
+        logging.info("%s: %s", arg, getattr(args, arg))
 
     logging.info('#' * 50)
 
@@ -98,6 +170,7 @@ def setup_logging(args):
         logging.getLogger().setLevel(logging.WARNING)
     else:
         logging.getLogger().setLevel(logging.INFO)
+    return full_log_path
 
 def signal_handler(sig, frame):
     print('Exiting gracefully...')
@@ -116,105 +189,95 @@ def generate_auth_header(api_key):
                       "Authentication header generation will fail.")
         sys.exit(0)
 
-# Function to check the rate limit and adjust wait time if needed
-def check_and_adjust_rate_limit(response, args):
-    remaining_calls = int(response.headers.get('X-Ratelimit-Remaining', 0))
-    if remaining_calls <= 40:
-        args.time_wait = max(args.time_wait, 1000)  # Slowing down API calls
-        logging.warning(f"Slowing down API requests due to low remaining calls. Current remaining {remaining_calls}")
-    else:
-        args.time_wait = original_time_wait  # Resetting to original time wait
-        logging.info(f"Returning API timewait to original value. Current remaining {remaining_calls}")
+# Function to return the authorization header, generating it only once
+def get_auth_header():
+    global auth_header
+    if auth_header is None:
+        auth_header = generate_auth_header(API_KEY)
+    return auth_header
 
-# Function to handle API requests with retries for timeouts and handle specific error codes
-def make_api_request(method, url, headers, data=None, retries=2):
-    try:
-        response = requests.request(method, url, headers=headers, json=data)
-        if response.status_code == 403:  # Handling 403 Forbidden Error
-            logging.error(f"403 Forbidden error encountered. URL: {url} Method: {method}")
-            print("It looks like FreshWorks doesn't like what you were doing and the user was locked.")
-            print("Please check in FreshService that the user who your API KEY corresponds to is not locked.")
-            print("https://support.cloudblue.com/agents")
-            exit(1)
-        elif response.status_code == 401:  # Handling 401 Unauthorized Error
-            logging.error(f"401 Unauthorized error encountered. URL: {url} Method: {method}")
-            print("It looks like the API KEY you provided has a problem.")
-            print("Follow these instructions to make sure you are getting the correct API KEY:")
-            print("https://support.freshservice.com/en/support/solutions/articles/50000000306-where-do-i-find-my-api-key-")
-            print("Once you have the correct API KEY, open the .env file located in the root folder of the script to update the value.")
-            exit(1)
-        elif response.status_code == 429:  # Handling 429 Too Many Requests Error
-            logging.error(f"429 Too Many Requests error encountered. URL: {url} Method: {method}")
-            print("It looks like you exceeded the API rate limit.")
-            print("Go get a coffee, check your user isn't locked, and try again.")
-            exit(1)
-        response.raise_for_status()
-        return response
-    except requests.exceptions.Timeout:
-        if retries > 0:
-            time.sleep(2)
-            return make_api_request(method, url, headers, data, retries - 1)
-        else:
-            raise
-    except requests.exceptions.RequestException as e:
-        logging.error(f"API request failed: {e}")
-        raise
+# Function to fetch every page of a directory endpoint in parallel. Yields the records in page order.
+def get_directory_records(base_url, headers, entity):
+    def fetch_page(page):
+        url = f"{base_url}/api/v2/{entity}?per_page=100&page={page}"
+        data = get_json(url, headers, f"{entity}_page")
+        return data.get(entity) or [], None
+
+    for records in get_scheduler().fetch_pages(fetch_page):
+        yield from records
 
 # Functions to retrieve companies, agents, and groups
 def get_company_names(base_url, headers):
     companies = {}
-    page = 1
-    while True:
-        url = f"https://{base_url}.freshservice.com/api/v2/departments?per_page=100&page={page}"
-        response = make_api_request("GET", url, headers)
-        data = response.json()
-
-        # Check if there are departments in the response
-        if 'departments' in data and data['departments']:
-            for company in data['departments']:
-                companies[company['id']] = company['name']
-            page += 1
-        else:
-            break
+    for company in get_directory_records(base_url, headers, 'departments'):
+        companies[company['id']] = company['name']
     return companies
 
 def get_agents(base_url, headers):
     agents = {}
-    page = 1
-    while True:
-        url = f"https://{base_url}.freshservice.com/api/v2/agents?per_page=100&page={page}"
-        response = make_api_request("GET", url, headers)
-        data = response.json()
-
-        if 'agents' in data and data['agents']:
-            for agent in data['agents']:
-                agent_info = {
-                    'name': f"{agent['first_name']} {agent['last_name']}".strip(),
-                    'email': agent['email']
-                }
-                agents[agent['id']] = agent_info
-            page += 1
-        else:
-            break
+    for agent in get_directory_records(base_url, headers, 'agents'):
+        agents[agent['id']] = format_agent(agent)
     return agents
 
 def get_groups(base_url, headers):
     groups = {}
-    page = 1
-    while True:
-        url = f"https://{base_url}.freshservice.com/api/v2/groups?per_page=100&page={page}"
-        response = make_api_request("GET", url, headers)
-        data = response.json()
-
-        # Check if there are groups in the response
-        if 'groups' in data and data['groups']:
-            for group in data['groups']:
-                groups[group['id']] = group['name']
-            page += 1
-        else:
-            break
+    for group in get_directory_records(base_url, headers, 'groups'):
+        groups[group['id']] = group['name']
     return groups
 
+def format_agent(agent):
+    return {
+        'name': f"{agent['first_name']} {agent['last_name']}".strip(),
+        'email': agent['email']
+    }
+
+# Function to fetch a single department, agent or group by ID. Returns None if it does not exist.
+def get_reference_record(base_url, headers, entity, record_id):
+    url = f"{base_url}/api/v2/{entity}/{record_id}"
+    try:
+        response = make_api_request("GET", url, headers)
+    except requests.exceptions.HTTPError as e:
+        if e.response is not None and e.response.status_code == 404:
+            return None
+        raise
+    data = response.json()
+
+    if entity == 'departments':
+        return data['department']['name']
+    elif entity == 'agents':
+        return format_agent(data['agent'])
+    return data['group']['name']
+
+# Function to return the FreshService URL for the selected mode, unless --base-url overrides it
+def get_base_url(args):
+    return (args.base_url or FRESH_SERVICE_ENDPOINTS[args.mode]).rstrip('/')
+
+# Function to return the local ticket store for the selected FreshService instance
+def get_ticket_store(args):
+    global ticket_store
+    if ticket_store is None:
+        ticket_store = TicketStore(Path(CACHE_DIRECTORY).resolve() / f"fsc_{args.mode}.sqlite3")
+    return ticket_store
+
+# Function to return the profiler used for --profile and profiled requests
+def get_refresh_profiler(args):
+    global refresh_profiler
+    if refresh_profiler is None:
+        refresh_profiler = RefreshProfiler(Path(PROFILE_DIRECTORY).resolve(), args.profile_top)
+    return refresh_profiler
+
+# Function to check the profile token sent with a request, in constant time
+def is_profile_token(token):
+    expected = app_args.profile_token if app_args is not None else None
+    return bool(expected) and hmac.compare_digest(token.encode('utf-8'), expected.encode('utf-8'))
+
+# Function to return the reference cache for the selected FreshService instance
+def get_reference_cache(args):
+    global reference_cache
+    if reference_cache is None:
+        reference_cache = ReferenceCache(get_ticket_store(args), REFERENCE_TTLS)
+    return reference_cache
+
 # section for utility methods
 def sanitize_user_input(input_string):
     """
@@ -234,24 +297,413 @@ def sanitize_user_input(input_string):
 def index():
     return render_template('tickets.html')
 
+# Function to run the FreshService crawl and return the sorted ticket list.
+# progress(ticket) is called for each ticket of a full crawl as soon as it is scored.
+def refresh_tickets(args, progress=None):
+    sync_type = 'full' if args.sync_mode == 'full' or ticket_sync.needs_full_sync() else 'incremental'
+    api_calls = metrics.API_REQUESTS.total()
+    try:
+        with metrics.STAGE_SECONDS.labels(f"{sync_type}_refresh").time():
+            if args.profile:
+                with get_refresh_profiler(args).profile(f"{sync_type}_refresh"):
+                    sorted_tickets = run_refresh(args, sync_type, progress)
+            else:
+                sorted_tickets = run_refresh(args, sync_type, progress)
+    except Exception:
+        metrics.REFRESHES.labels(sync_type, 'error').inc()
+        raise
+    metrics.REFRESHES.labels(sync_type, 'ok').inc()
+    metrics.REFRESH_API_CALLS.set(metrics.API_REQUESTS.total() - api_calls)
+    return sorted_tickets
+
+# Function to return the departments, agents and groups directories, and the lookup for records they are missing
+def get_reference_directories(args, base_url, headers):
+    cache = get_reference_cache(args)
+
+    companies = cache.get_directory('departments', lambda: get_company_names(base_url, headers))
+    agents = cache.get_directory('agents', lambda: get_agents(base_url, headers))
+    groups = cache.get_directory('groups', lambda: get_groups(base_url, headers))
+
+    def lookup_missing(entity, record_id):
+        return cache.lookup(entity, record_id, lambda missing_id: get_reference_record(base_url, headers, entity, missing_id))
+
+    return companies, agents, groups, lookup_missing
+
+def run_refresh(args, sync_type, progress):
+    base_url = get_base_url(args)
+    headers = get_auth_header()
+    companies, agents, groups, lookup_missing = get_reference_directories(args, base_url, headers)
+
+    started_at = time.time()
+    if sync_type == 'full':
+        tickets = []
+        for ticket in iter_scored_tickets(base_url, headers, agents, companies, groups, lookup_missing):
+            tickets.append(ticket)
+            if progress is not None:
+                progress(ticket)
+        ticket_sync.replace(tickets, started_at)
+    else:
+        updated_tickets, closed_tickets = get_updated_tickets(base_url, headers, ticket_sync.watermark, agents, companies, groups, lookup_missing)
+        # Only the updated tickets are scored and moved in the queue, the rest keep their place
+        with metrics.STAGE_SECONDS.labels('make_status_priority_readable').time():
+            make_status_priority_readable(updated_tickets)
+        with metrics.STAGE_SECONDS.labels('score').time():
+            score_tickets(updated_tickets)
+        ticket_sync.merge(updated_tickets, closed_tickets, started_at)
+
+    with metrics.STAGE_SECONDS.labels('order').time():
+        sorted_tickets = ticket_sync.ordered()
+    try:
+        with metrics.STAGE_SECONDS.labels('store').time():
+            store = get_ticket_store(args)
+            if sync_type == 'full':
+                store.save_tickets(sorted_tickets, ticket_sync.watermark, ticket_sync.last_full_sync)
+            else:
+                # Only write the rows the delta touched, the rest of the stored backlog is unchanged
+                positions = {ticket['id']: (ticket_sync.rank(ticket['id']) or (0, 0))[0] for ticket in updated_tickets}
+                store.update_tickets(updated_tickets, [ticket['id'] for ticket in closed_tickets],
+                                     ticket_sync.watermark, ticket_sync.last_full_sync, positions)
+    except sqlite3.Error as e:
+        logging.warning(f"Could not save tickets to the ticket store: {e}")
+    return sorted_tickets
+
+# Function called by the deadline scheduler when tickets pass their due dates
+def apply_passed_deadlines(due):
+    if ticket_sync.mark_past_due(due):
+        ticket_snapshot.republish(ticket_sync.ordered)
+
+# Function to set up the HTTP transport and request scheduler used for every FreshService call
+def configure_api_client(args):
+    configure_transport(get_auth_header(), args.pool_size, args.connect_timeout, args.read_timeout)
+    configure_scheduler(args.workers, args.time_wait)
+
+# Function to crawl the tickets in the given statuses for an export.
+# Yields chunks of scored tickets in queue order, holding only one chunk in memory.
+def iter_export_tickets(args, statuses, chunk_size=DEFAULT_CHUNK_SIZE):
+    base_url = get_base_url(args)
+    headers = get_auth_header()
+    companies, agents, groups, lookup_missing = get_reference_directories(args, base_url, headers)
+    tickets = iter_scored_tickets(base_url, headers, agents, companies, groups, lookup_missing, statuses)
+    return iter_sorted_chunks(tickets, chunk_size)
+
+# Function to run a headless export from the command line. Returns the process exit code.
+def run_export(args):
+    export_format = args.export_format or ('parquet' if args.export.endswith('.parquet') else 'csv')
+    try:
+        check_export_format(export_format)
+        statuses = parse_status_scope(args.export_scope)
+    except ValueError as e:
+        logging.error(f"Export failed: {e}")
+        print(f"Export failed: {e}", file=sys.stderr)
+        return 1
+
+    configure_api_client(args)
+    started = time.time()
+    exported = 0
+
+    def count(chunks):
+        nonlocal exported
+        for chunk in chunks:
+            exported += len(chunk)
+            yield chunk
+
+    output = sys.stdout.buffer if args.export == '-' else None
+    try:
+        chunks = count(iter_export_tickets(args, statuses, args.export_chunk_size))
+        if output is None:
+            output = open(args.export, 'wb')
+        for data in export_chunks(chunks, export_format):
+            output.write(data)
+        output.flush()
+    except Exception as e:
+        logging.exception("Export failed.")
+        print(f"Export failed: {e}", file=sys.stderr)
+        if output is not None and output is not sys.stdout.buffer:
+            # Do not leave a partial export behind that looks complete
+            output.close()
+            os.remove(args.export)
+        return 1
+    finally:
+        if output is not None and output is not sys.stdout.buffer:
+            output.close()
+    logging.info(f"Exported {exported} tickets to {args.export} as {export_format} in {time.time() - started:.2f}s.")
+    print(f"Exported {exported} tickets to {args.export} as {export_format}.", file=sys.stderr)
+    return 0
+
+# Function to return the shared ticket snapshot, starting its refresher on first use
+def get_ticket_snapshot(args=None):
+    global ticket_snapshot, ticket_sync, deadline_scheduler, app_args
+    with ticket_snapshot_lock:
+        if ticket_snapshot is None:
+            if args is None:
+                args = parse_arguments()
+            app_args = args
+            configure_api_client(args)
+            deadline_scheduler = DeadlineScheduler(apply_passed_deadlines)
+            ticket_sync = TicketSync(args.full_sync_interval, deadline_scheduler)
+            fetch_function = lambda progress: refresh_tickets(args, progress)
+            if args.shared_snapshot:
+                ticket_snapshot = SharedTicketSnapshot(fetch_function, args.refresh_interval, args.shared_snapshot, args.poll_interval)
+                is_fetcher = ticket_snapshot.election.try_acquire()
+            else:
+                ticket_snapshot = TicketSnapshot(fetch_function, args.refresh_interval)
+                is_fetcher = True
+
+            # Serve the last saved tickets straight away and refresh behind them.
+            # Workers that do not crawl pick up the fetcher's snapshot instead.
+            stored_tickets = get_ticket_store(args).load_tickets() if is_fetcher else None
+            if stored_tickets:
+                watermark, last_full_sync = get_ticket_store(args).load_sync_state()
+                ticket_sync.restore(stored_tickets, watermark, last_full_sync)
+                # Stored positions are only exact after a full save, so publish the re-sorted queue
+                ticket_snapshot.publish(ticket_sync.ordered())
+            ticket_snapshot.start()
+            deadline_scheduler.start()
+            register_snapshot_metrics(ticket_snapshot)
+    return ticket_snapshot
+
+# Function to read the snapshot gauges at scrape time instead of tracking them on every change
+def register_snapshot_metrics(snapshot):
+    metrics.SNAPSHOT_TICKETS.set_function(lambda: len(snapshot.tickets) if snapshot.tickets is not None else None)
+    metrics.SNAPSHOT_AGE.set_function(lambda: time.time() - snapshot.updated_at if snapshot.updated_at else None)
+    metrics.SNAPSHOT_VERSION.set_function(lambda: snapshot.version)
+
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    return Response(metrics.REGISTRY.render(), mimetype='text/plain; version=0.0.4')
+
 @app.route('/tickets', methods=['GET'])
 def get_tickets():
-    args = parse_arguments()
-
-    companies = get_company_names(FRESH_SERVICE_ENDPOINTS[args.mode], generate_auth_header(API_KEY))
-    agents = get_agents(FRESH_SERVICE_ENDPOINTS[args.mode], generate_auth_header(API_KEY))
-    groups = get_groups(FRESH_SERVICE_ENDPOINTS[args.mode], generate_auth_header(API_KEY))
-
-    tickets = get_all_tickets(FRESH_SERVICE_ENDPOINTS[args.mode], generate_auth_header(API_KEY), agents, companies, groups)
-    readable_tickets = make_status_priority_readable(tickets)
-    sorted_tickets = sort_tickets(readable_tickets)
+    snapshot = get_ticket_snapshot()
+    token = request.headers.get(PROFILE_HEADER)
+    if token is None:
+        return serve_tickets(snapshot)
+    if not is_profile_token(token):
+        return jsonify({'error': 'Profiling is not enabled or the profile token is wrong.'}), 403
+
+    # Run a refresh and build the response under the profiler, so the whole pipeline shows up
+    with get_refresh_profiler(app_args).profile('tickets_request') as profile:
+        snapshot.refresh()
+        response = app.make_response(serve_tickets(snapshot))
+    # No profile is saved when another one was already running
+    if profile.pstats_path is not None:
+        response.headers['X-Profile'] = profile.name
+    return response
+
+# Function to build the /tickets response from the current snapshot
+def serve_tickets(snapshot):
+    if request.args.get('stream') == 'ndjson':
+        return Response(generate_ndjson(snapshot), mimetype='application/x-ndjson',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+    snapshot.get()
+    version, etag, sorted_tickets = snapshot.state()
+    if sorted_tickets is None:
+        return jsonify({'error': 'Tickets are not available yet. Check the logs for API errors.'}), 503
+
+    # The full list is serialized and compressed once per version, so pick the cached bytes
+    encoded_body = snapshot.encoded_body(version) if not request.args else None
+    encoding = choose_encoding(request.accept_encodings) if encoded_body is not None else 'identity'
+    if request.query_string:
+        # Each query gets its own ETag so filtered responses are cached separately
+        etag = f"{etag}-{hashlib.sha1(request.query_string).hexdigest()[:12]}"
+    elif encoding != 'identity':
+        # Each encoding is a different representation, so it gets its own ETag too
+        etag = f"{etag}-{encoding}"
+    if request.if_none_match.contains(etag):
+        response = app.response_class(status=304)
+        response.vary.add('Accept-Encoding')
+        return make_ticket_response(response, version, etag)
+
+    if encoded_body is not None:
+        body = encoded_body.get(encoding)
+        response = app.response_class(response_body(body), mimetype='application/json')
+        response.content_length = len(body)
+        if encoding != 'identity':
+            response.headers['Content-Encoding'] = encoding
+        response.vary.add('Accept-Encoding')
+        return make_ticket_response(response, version, etag)
+
+    if not request.args:
+        with metrics.STAGE_SECONDS.labels('serialize').time():
+            response = jsonify(sorted_tickets)
+        return make_ticket_response(response, version, etag)
+
+    # Filter, project and page on the server when the client asks for it
+    try:
+        filters, fields, offset, limit = parse_ticket_query(request.args)
+        ticket_index = snapshot.derived('index', TicketIndex)
+        tickets, total = run_ticket_query(ticket_index, filters, fields, offset, limit)
+    except QueryError as e:
+        return jsonify({'error': str(e)}), 400
+
+    with metrics.STAGE_SECONDS.labels('serialize').time():
+        response = make_ticket_response(jsonify(tickets), version, etag)
+    response.headers['X-Total-Count'] = str(total)
+    return response
+
+# Function to stream the tickets as NDJSON. Each ticket is sent as {"type": "ticket", "data": {...}}
+# and the last line is {"type": "order", ...} with the ticket IDs in queue order. If no snapshot
+# exists yet, tickets are sent as the crawl produces them instead of waiting for it to finish.
+def generate_ndjson(snapshot):
+    version, etag, tickets = snapshot.state()
+    source = tickets if tickets is not None else snapshot.follow_crawl()
+
+    chunk = []
+    for ticket in source:
+        chunk.append(json.dumps({'type': 'ticket', 'data': ticket}, default=json_default))
+        if len(chunk) >= STREAM_CHUNK_SIZE:
+            yield '\n'.join(chunk) + '\n'
+            chunk = []
+    if chunk:
+        yield '\n'.join(chunk) + '\n'
+
+    version, etag, tickets = snapshot.state()
+    if tickets is None:
+        yield json.dumps({'type': 'error', 'error': 'Tickets are not available yet. Check the logs for API errors.'}) + '\n'
+    else:
+        yield json.dumps({'type': 'order', 'version': version, 'ids': [ticket['id'] for ticket in tickets]}) + '\n'
+
+@app.route('/tickets/changes', methods=['GET'])
+def get_ticket_changes():
+    snapshot = get_ticket_snapshot()
+    version, sorted_tickets = snapshot.get()
+    if sorted_tickets is None:
+        return jsonify({'error': 'Tickets are not available yet. Check the logs for API errors.'}), 503
+
+    since = request.args.get('since', type=int)
+    if since is None:
+        return jsonify({'error': 'The since parameter must be a ticket version number.'}), 400
+
+    changes = snapshot.changes_since(since)
+    if changes is None:
+        # The version is too old or from an earlier run, so send everything
+        return make_ticket_response(jsonify({'version': version, 'since': since, 'full': True, 'tickets': sorted_tickets}), version)
+
+    version, diff = changes
+    return make_ticket_response(jsonify({'version': version, 'since': since, 'full': False, **diff}), version)
+
+@app.route('/tickets/<int:ticket_id>/position', methods=['GET'])
+def get_ticket_position(ticket_id):
+    snapshot = get_ticket_snapshot()
+    version, sorted_tickets = snapshot.get()
+    if sorted_tickets is None:
+        return jsonify({'error': 'Tickets are not available yet. Check the logs for API errors.'}), 503
+
+    if ticket_sync.tickets:
+        position = ticket_sync.rank(ticket_id)
+        ticket = ticket_sync.tickets.get(ticket_id)
+    else:
+        # Workers that do not crawl keep no queue index of their own, so look the ticket up in the snapshot
+        positions = snapshot.derived('positions', lambda tickets: {ticket['id']: rank for rank, ticket in enumerate(tickets)})
+        rank = positions.get(ticket_id)
+        position = None if rank is None else (rank, len(sorted_tickets))
+        ticket = None if rank is None else sorted_tickets[rank]
+    if position is None:
+        return jsonify({'error': f'Ticket {ticket_id} is not in the open ticket queue.'}), 404
+    rank, total = position
+    return make_ticket_response(jsonify({'id': ticket_id, 'rank': rank, 'position': rank + 1, 'total': total,
+                                         'score': ticket['score'] if ticket else None}), version)
+
+@app.route('/tickets/summary', methods=['GET'])
+def get_ticket_summary():
+    snapshot = get_ticket_snapshot()
+    version, sorted_tickets = snapshot.get()
+    if sorted_tickets is None:
+        return jsonify({'error': 'Tickets are not available yet. Check the logs for API errors.'}), 503
+
+    # The counters published with this version. Workers that do not crawl read a plain list
+    # from the shared snapshot, so they count it themselves once per version.
+    summary = getattr(sorted_tickets, 'summary', None)
+    if summary is None:
+        summary = snapshot.derived('summary', lambda tickets: QueueSummary(tickets).to_dict())
+    return make_ticket_response(jsonify({'version': version, **summary}), version)
+
+@app.route('/tickets/export', methods=['GET'])
+def export_tickets():
+    export_format = request.args.get('format', 'csv').lower()
+    try:
+        check_export_format(export_format)
+        statuses = parse_status_scope(request.args.get('scope'))
+        chunk_size = int(request.args.get('chunk_size', DEFAULT_CHUNK_SIZE))
+        if chunk_size < 1:
+            raise ValueError("chunk_size must be a positive number.")
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    snapshot = get_ticket_snapshot()
+    crawl = set(statuses) != set(OPEN_STATUSES)
+    if not crawl:
+        # The open queue is already in memory and in order, no crawl needed
+        version, sorted_tickets = snapshot.get()
+        if sorted_tickets is None:
+            return jsonify({'error': 'Tickets are not available yet. Check the logs for API errors.'}), 503
+        chunks = iter_chunks(sorted_tickets, chunk_size)
+    else:
+        # Only one crawling export at a time, each one costs a full crawl of the FreshService rate limit
+        if not export_lock.acquire(blocking=False):
+            return jsonify({'error': 'Another export is crawling FreshService. Try again when it has finished.'}), 429
+        try:
+            chunks = iter_export_tickets(app_args, statuses, chunk_size)
+        except Exception:
+            export_lock.release()
+            raise
 
-    return jsonify(sorted_tickets)
+    filename = f"fsc_tickets_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{export_format}"
+    response = Response(stream_with_context(export_chunks(chunks, export_format)), content_type=EXPORT_CONTENT_TYPES[export_format],
+                        headers={'Content-Disposition': f'attachment; filename="{filename}"', 'X-Accel-Buffering': 'no'})
+    if crawl:
+        # Released when the download ends, also if the client disconnects before it starts
+        response.call_on_close(export_lock.release)
+    return response
+
+@app.route('/tickets/stream', methods=['GET'])
+def stream_tickets():
+    snapshot = get_ticket_snapshot()
+    subscription = snapshot.subscribe()
+
+    def generate():
+        try:
+            # Tell the client which version is current so it can catch up straight away
+            yield format_event('version', {'version': snapshot.version}, snapshot.version)
+            # A subscriber dropped for falling behind gets no more events, so end the stream and let
+            # EventSource reconnect; the version event on reconnect tells it to reload
+            while not subscription.closed:
+                try:
+                    event = subscription.get(timeout=STREAM_HEARTBEAT)
+                except queue.Empty:
+                    # Comments keep proxies from closing the connection and detect closed clients
+                    yield ': keep-alive\n\n'
+                    continue
+                yield format_event('tickets', event, event['version'])
+        finally:
+            snapshot.unsubscribe(subscription)
+
+    return Response(generate(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+# Function to format one Server-Sent Events message
+def format_event(event, data, event_id):
+    return f"id: {event_id}\nevent: {event}\ndata: {json.dumps(data, default=json_default)}\n\n"
+
+# Function to add the snapshot version and caching headers to a ticket response
+def make_ticket_response(response, version, etag=None):
+    response.headers['X-Ticket-Version'] = str(version)
+    # Browsers must revalidate every time, the ETag makes that cheap
+    response.headers['Cache-Control'] = 'no-cache'
+    if etag is not None:
+        response.set_etag(etag)
+    return response
 
 if __name__ == "__main__":
     args = parse_arguments()
-    setup_logging(args)
+    # Keep standard output clean when the export is written to it
+    setup_logging(args, console_stream=sys.stderr if args.export == '-' else None)
+    if args.export:
+        sys.exit(run_export(args))
     # Register the signal handler
     signal.signal(signal.SIGINT, signal_handler)
+    # Start crawling in the background so the first page load does not wait
+    get_ticket_snapshot(args)
     debug_mode = False if args.log_level.upper() == 'DEBUG' else False
-    app.run(debug=False, use_reloader=False, host='127.0.0.1', port=5000)
+    app.run(debug=False, use_reloader=False, host='127.0.0.1', port=args.port)
@@ -0,0 +1,207 @@
+################################################################################
+# run_benchmarks.py measures FSC Suite against the local fake FreshService.
+#
+# - Scoring, queue ordering and serialization time at 1k/10k/100k tickets
+# - End-to-end: cold crawl time, pages/sec, API calls per full and
+#   incremental refresh, and /tickets latency
+#
+# Results are printed as a table and can be written to a JSON file, so runs
+# before and after a change can be compared:
+#   python benchmarks/run_benchmarks.py --output before.json
+#
+# Author: Taylor Giddens - taylor.giddens@ingrammicro.com
+# Version: 1.0.3
+################################################################################
+import argparse
+import hashlib
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import requests
+
+ROOT_DIRECTORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIRECTORY)
+
+from lib.fake_freshservice import FakeData, FakeFreshService
+from lib.bodies import EncodedBody, encode_tickets
+from lib.priority_index import PriorityIndex
+from lib.sync import TicketSync
+from lib.tickets import make_ticket_readable, score_tickets, transform_ticket
+
+SIZES = [1000, 10000, 100000]
+APP_PORT = 5099
+FAKE_PORT = 8199
+BENCHMARK_API_KEY = 'benchmarkkey'
+
+
+# Function to print a timestamped progress line, same format as the app
+def report(message):
+    print(f"{datetime.now().strftime('%Y-%m-%d %H:%M:%S')} - {message}")
+
+# Function to time a callable. Returns the best of several runs in seconds.
+def best_time(function, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+# Function to build transformed, readable ticket records from synthetic FreshService data
+def build_tickets(size):
+    data = FakeData(tickets=size)
+    companies = {record['id']: record['name'] for record in data.departments}
+    agents = {record['id']: {'name': f"{record['first_name']} {record['last_name']}", 'email': record['email']}
+              for record in data.agents}
+    groups = {record['id']: record['name'] for record in data.groups}
+    return [make_ticket_readable(transform_ticket(ticket, agents, companies, groups)) for ticket in data.tickets]
+
+# Function to measure scoring, queue ordering and serialization at each size, on the paths a refresh runs
+def run_micro_benchmarks(sizes, repeat):
+    results = {}
+    for size in sizes:
+        report(f"Building {size} synthetic tickets.")
+        tickets = build_tickets(size)
+        score_tickets(tickets)
+        ticket_sync = TicketSync(full_sync_interval=3600)
+        ticket_sync.replace(tickets)
+        body = encode_tickets(ticket_sync.ordered())
+        results[size] = {
+            'score_seconds': best_time(lambda: score_tickets(tickets), repeat),
+            'index_seconds': best_time(lambda: PriorityIndex(tickets), repeat),
+            'order_seconds': best_time(ticket_sync.ordered, repeat),
+            'serialize_seconds': best_time(lambda: encode_tickets(tickets), repeat),
+            'etag_seconds': best_time(lambda: hashlib.sha1(body).hexdigest(), repeat),
+            'gzip_seconds': best_time(lambda: EncodedBody(encode_tickets(tickets)).get('gzip'), repeat),
+        }
+        report(f"{size} tickets: " + ', '.join(f"{key} {value * 1000:.1f}ms" for key, value in results[size].items()))
+    return results
+
+# Function to wait until the app answers /tickets. Returns the seconds it took.
+def wait_for_tickets(app_url, started, timeout):
+    while time.time() - started < timeout:
+        try:
+            response = requests.get(f"{app_url}/tickets", timeout=5)
+            if response.status_code == 200:
+                return time.time() - started
+        except requests.exceptions.RequestException:
+            pass
+        time.sleep(0.1)
+    raise RuntimeError(f"The app did not serve /tickets within {timeout} seconds.")
+
+# Function to sum the API calls in a /_stats response, optionally for one endpoint only
+def count_calls(stats, endpoint=None):
+    return sum(entry['count'] for key, entry in stats.items() if endpoint is None or key == endpoint)
+
+# Function to measure a full crawl and steady-state serving against the fake server
+def run_end_to_end(args):
+    report(f"Starting fake FreshService with {args.tickets} tickets.")
+    fake = FakeFreshService(FakeData(tickets=args.tickets, churn=args.churn), port=args.fake_port,
+                            latency=args.latency, jitter=args.jitter, rate_limit=args.rate_limit,
+                            error_rate=args.error_rate).start()
+    app_url = f"http://127.0.0.1:{args.app_port}"
+    working_directory = tempfile.mkdtemp(prefix='fsc-bench-')
+    command = [sys.executable, os.path.join(ROOT_DIRECTORY, 'app.py'), '-m', 'test', '--base-url', fake.base_url,
+               '-p', str(args.app_port), '-r', str(args.refresh_interval), '-l', 'WARNING']
+    # Run from a temporary folder so logs and the ticket cache start empty
+    process = subprocess.Popen(command, cwd=working_directory, stdin=subprocess.PIPE,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, text=True)
+    try:
+        started = time.time()
+        process.stdin.write(BENCHMARK_API_KEY + '\n')
+        process.stdin.flush()
+
+        cold_seconds = wait_for_tickets(app_url, started, args.timeout)
+        stats = fake.snapshot_stats(reset=True)
+        pages = stats.get('tickets/filter', {'count': 0, 'first': 0, 'last': 0})
+        crawl_seconds = (pages['last'] - pages['first']) if pages['count'] > 1 else 0
+        report(f"Cold start served /tickets after {cold_seconds:.2f}s.")
+
+        latencies = []
+        etag = None
+        for _ in range(args.requests):
+            request_started = time.perf_counter()
+            response = requests.get(f"{app_url}/tickets", timeout=30)
+            latencies.append(time.perf_counter() - request_started)
+            etag = response.headers.get('ETag')
+        conditional = []
+        for _ in range(args.requests):
+            request_started = time.perf_counter()
+            requests.get(f"{app_url}/tickets", headers={'If-None-Match': etag}, timeout=30)
+            conditional.append(time.perf_counter() - request_started)
+
+        # Wait for at least one background refresh, which runs incrementally after the first crawl
+        report(f"Waiting {args.refresh_interval + 2}s for an incremental refresh.")
+        time.sleep(args.refresh_interval + 2)
+        incremental_stats = fake.snapshot_stats(reset=True)
+
+        return {
+            'tickets': args.tickets,
+            'cold_start_seconds': cold_seconds,
+            'crawl_seconds': crawl_seconds,
+            'ticket_pages': pages['count'],
+            'pages_per_second': pages['count'] / crawl_seconds if crawl_seconds else None,
+            'api_calls_full_refresh': count_calls(stats),
+            'rate_limited_responses': count_calls(stats, '429') + count_calls(incremental_stats, '429'),
+            'api_calls_incremental_refresh': count_calls(incremental_stats),
+            'tickets_p50_ms': statistics.median(latencies) * 1000,
+            'tickets_p95_ms': sorted(latencies)[int(len(latencies) * 0.95) - 1] * 1000,
+            'tickets_304_p50_ms': statistics.median(conditional) * 1000,
+        }
+    finally:
+        process.terminate()
+        process.wait(timeout=10)
+        fake.stop()
+
+def print_results(results):
+    print()
+    print(f"{'Tickets':>10} {'Score ms':>10} {'Index ms':>10} {'Order ms':>10} {'JSON ms':>10} {'ETag ms':>10} {'Gzip ms':>10}")
+    for size, timings in results.get('micro', {}).items():
+        print(f"{size:>10} {timings['score_seconds'] * 1000:>10.1f} {timings['index_seconds'] * 1000:>10.1f} "
+              f"{timings['order_seconds'] * 1000:>10.1f} "
+              f"{timings['serialize_seconds'] * 1000:>10.1f} {timings['etag_seconds'] * 1000:>10.1f} "
+              f"{timings['gzip_seconds'] * 1000:>10.1f}")
+    if 'end_to_end' in results:
+        print()
+        for key, value in results['end_to_end'].items():
+            print(f"{key:<32} {value:.2f}" if isinstance(value, float) else f"{key:<32} {value}")
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description='Benchmark FSC Suite against the local fake FreshService server.')
+    parser.add_argument('--sizes', type=int, nargs='+', default=SIZES, help='Ticket counts for the scoring and serialization benchmarks.')
+    parser.add_argument('--repeat', type=int, default=3, help='Runs per measurement, the best one is reported.')
+    parser.add_argument('--tickets', type=int, default=10000, help='Ticket count for the end-to-end benchmark.')
+    parser.add_argument('--churn', type=int, default=600, help='Tickets updated per minute on the fake server.')
+    parser.add_argument('--latency', type=float, default=0.05, help='Seconds added to every fake API request.')
+    parser.add_argument('--jitter', type=float, default=0.05, help='Up to this many extra seconds added at random.')
+    parser.add_argument('--rate-limit', type=int, default=5000, help='Fake API requests allowed per minute.')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Share of fake API requests answered with a 429.')
+    parser.add_argument('--requests', type=int, default=50, help='Number of /tickets requests to time.')
+    parser.add_argument('--refresh-interval', type=int, default=5, help='Refresh interval passed to the app.')
+    parser.add_argument('--timeout', type=int, default=600, help='Seconds to wait for the first crawl.')
+    parser.add_argument('--app-port', type=int, default=APP_PORT, help='Port for the app under test.')
+    parser.add_argument('--fake-port', type=int, default=FAKE_PORT, help='Port for the fake FreshService server.')
+    parser.add_argument('--skip-micro', action='store_true', help='Skip the scoring and serialization benchmarks.')
+    parser.add_argument('--skip-end-to-end', action='store_true', help='Skip the end-to-end benchmark.')
+    parser.add_argument('--output', help='Write the results to this JSON file.')
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_arguments()
+    results = {}
+    if not args.skip_micro:
+        results['micro'] = run_micro_benchmarks(args.sizes, args.repeat)
+    if not args.skip_end_to_end:
+        results['end_to_end'] = run_end_to_end(args)
+    print_results(results)
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            json.dump(results, output_file, indent=2)
+        report(f"Results written to {args.output}")
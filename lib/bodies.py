@@ -0,0 +1,88 @@
+################################################################################
+# bodies.py serializes and compresses the ticket list once per snapshot version.
+#
+# - orjson when it is installed, the standard json module otherwise
+# - gzip, and brotli when it is installed, made on first use and kept
+# - Content negotiation from the Accept-Encoding request header
+# - Shared snapshot bodies sent from the memory map without a whole copy
+#
+# Author: Taylor Giddens - taylor.giddens@ingrammicro.com
+# Version: 1.0.3
+################################################################################
+import gzip
+import json
+import threading
+from lib.records import json_default
+
+try:
+    import orjson
+except ImportError:  # orjson is optional, it only makes serialization faster
+    orjson = None
+
+try:
+    import brotli
+except ImportError:  # brotli is optional, gzip is always available
+    brotli = None
+
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+RESPONSE_CHUNK_SIZE = 256 * 1024
+
+# Encodings in order of preference when the client accepts several equally
+ENCODINGS = (['br'] if brotli is not None else []) + ['gzip', 'identity']
+
+
+# Function to serialize a ticket list to JSON bytes
+def encode_tickets(tickets):
+    if orjson is not None:
+        return orjson.dumps(tickets, default=json_default)
+    return json.dumps(tickets, separators=(',', ':'), default=json_default).encode('utf-8')
+
+# Function to decode a serialized ticket list. body may be bytes or a memoryview.
+def decode_tickets(body):
+    if orjson is not None:
+        return orjson.loads(body)
+    return json.loads(bytes(body))
+
+# Function to return a body in a form a WSGI server can send. A memoryview over a shared
+# snapshot is sent in slices copied out as they are written, never as one whole copy.
+def response_body(body, chunk_size=RESPONSE_CHUNK_SIZE):
+    if isinstance(body, memoryview):
+        return (body[start:start + chunk_size].tobytes() for start in range(0, len(body), chunk_size))
+    return body
+
+# Function to pick the response encoding from a werkzeug Accept-Encoding header
+def choose_encoding(accept_encodings):
+    return accept_encodings.best_match(ENCODINGS, default='identity') or 'identity'
+
+
+class EncodedBody:
+    """
+    Serialized ticket list of one snapshot version. Compressed variants are
+    made the first time a client asks for them and reused by every request
+    for the same version after that.
+    """
+
+    def __init__(self, identity):
+        self._variants = {'identity': identity}
+        self._lock = threading.Lock()
+
+    @property
+    def identity(self):
+        return self._variants['identity']
+
+    # Function to return the body in the given encoding, compressing it on first use
+    def get(self, encoding):
+        variant = self._variants.get(encoding)
+        if variant is not None:
+            return variant
+        # Compress under the lock so concurrent first requests share one compression
+        with self._lock:
+            if encoding not in self._variants:
+                if encoding == 'gzip':
+                    self._variants[encoding] = gzip.compress(self.identity, compresslevel=GZIP_LEVEL, mtime=0)
+                elif encoding == 'br' and brotli is not None:
+                    self._variants[encoding] = brotli.compress(self.identity, quality=BROTLI_QUALITY)
+                else:
+                    raise ValueError(f"Unsupported encoding: {encoding}")
+            return self._variants[encoding]
@@ -0,0 +1,131 @@
+################################################################################
+# deadlines.py flips tickets to past due the moment their deadline passes.
+#
+# - Due dates parsed once into epoch seconds
+# - Min-heap of upcoming deadlines served by a single timer thread
+# - No API traffic, the change is published from the tickets already in memory
+#
+# Author: Taylor Giddens - taylor.giddens@ingrammicro.com
+# Version: 1.0.3
+################################################################################
+import heapq
+import logging
+import threading
+import time
+from lib.scoring import parse_timestamp
+
+# Deadline field -> flag that is set once the deadline has passed
+DEADLINE_FIELDS = {
+    'due_by': 'is_past_due',
+    'fr_due_by': 'is_fr_past_due',
+}
+
+# Deadline field -> flag that means the deadline no longer applies. FreshService keeps
+# fr_due_by on a ticket after the first response, so only unanswered tickets can breach it.
+SETTLED_BY = {
+    'fr_due_by': 'fr_responded',
+}
+
+
+# Function to convert a due date to epoch seconds. Returns None if it is missing or invalid.
+def parse_deadline(value):
+    if not value:
+        return None
+    epoch = parse_timestamp(value)
+    return epoch or None
+
+
+class DeadlineScheduler:
+    """
+    Keeps the next deadline of every open ticket in a min-heap and calls
+    on_due([(ticket_id, field), ...]) from a background thread as soon as
+    one or more of them pass.
+
+    Rescheduled and removed deadlines are not taken out of the heap. They
+    stay behind as stale entries and are skipped when they come up, which
+    keeps every change O(log n).
+    """
+
+    def __init__(self, on_due):
+        self.on_due = on_due
+        self._heap = []
+        self._deadlines = {}
+        self._condition = threading.Condition()
+        self._stopped = False
+        self._thread = None
+
+    # Function to start or update the deadlines of the given tickets
+    def track(self, tickets):
+        with self._condition:
+            for ticket in tickets:
+                for field, flag in DEADLINE_FIELDS.items():
+                    key = (ticket['id'], field)
+                    settled = ticket.get(flag) or (field in SETTLED_BY and ticket.get(SETTLED_BY[field]))
+                    epoch = None if settled else parse_deadline(ticket.get(field))
+                    if epoch is None:
+                        self._deadlines.pop(key, None)
+                    elif self._deadlines.get(key) != epoch:
+                        self._deadlines[key] = epoch
+                        heapq.heappush(self._heap, (epoch, ticket['id'], field))
+            self._compact()
+            self._condition.notify()
+
+    # Function to stop following the deadlines of tickets that are no longer open
+    def untrack(self, ticket_ids):
+        with self._condition:
+            for ticket_id in ticket_ids:
+                for field in DEADLINE_FIELDS:
+                    self._deadlines.pop((ticket_id, field), None)
+            self._compact()
+
+    # Function to replace every tracked deadline, used after a full crawl
+    def reset(self, tickets):
+        with self._condition:
+            self._deadlines = {}
+            self._heap = []
+        self.track(tickets)
+
+    # Function to drop stale heap entries once they outnumber the live ones
+    def _compact(self):
+        if len(self._heap) > 2 * len(self._deadlines) + 1000:
+            self._heap = [(epoch, ticket_id, field) for (ticket_id, field), epoch in self._deadlines.items()]
+            heapq.heapify(self._heap)
+
+    # Function to start the timer thread
+    def start(self):
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name='ticket-deadlines', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        with self._condition:
+            self._stopped = True
+            self._condition.notify()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                due = self._pop_due(time.time())
+                while not due and not self._stopped:
+                    timeout = self._heap[0][0] - time.time() if self._heap else None
+                    self._condition.wait(timeout)
+                    due = self._pop_due(time.time())
+                if self._stopped:
+                    return
+
+            logging.info(f"{len(due)} ticket deadlines passed.")
+            try:
+                self.on_due(due)
+            except Exception:
+                logging.exception("Could not apply passed ticket deadlines.")
+
+    # Function to take every live deadline at or before now off the heap
+    def _pop_due(self, now):
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            epoch, ticket_id, field = heapq.heappop(self._heap)
+            if self._deadlines.get((ticket_id, field)) == epoch:
+                del self._deadlines[(ticket_id, field)]
+                due.append((ticket_id, field))
+        return due
@@ -0,0 +1,214 @@
+################################################################################
+# export.py streams the prioritized ticket queue out as CSV or Parquet.
+#
+# - Tickets spilled to a temporary SQLite file and read back in queue order,
+#   so only one chunk of tickets is held in memory however long the export is
+# - Chunked CSV, or one Parquet row group per chunk when pyarrow is installed
+# - Status scopes wider than the open ticket queue
+#
+# Author: Taylor Giddens - taylor.giddens@ingrammicro.com
+# Version: 1.0.3
+################################################################################
+import csv
+import io
+import json
+import os
+import sqlite3
+import tempfile
+from itertools import islice
+from lib.records import TICKET_FIELDS, TicketRecord, json_default
+from lib.scoring import parse_timestamp
+from lib.tickets import OPEN_STATUSES, STATUS_MAPPING
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:  # pyarrow is optional, only CSV exports are available without it
+    pyarrow = None
+
+DEFAULT_CHUNK_SIZE = 1000
+EXPORT_FORMATS = ['csv', 'parquet']
+
+# Named status scopes. Anything else is a comma separated list of status names or numbers.
+STATUS_SCOPES = {
+    'open': OPEN_STATUSES,
+    'all': sorted(STATUS_MAPPING),
+}
+
+EXPORT_CONTENT_TYPES = {
+    'csv': 'text/csv; charset=utf-8',
+    'parquet': 'application/vnd.apache.parquet',
+}
+
+
+# Function to turn a status scope into FreshService status numbers, e.g. 'open', 'all' or 'Open,Resolved,5'.
+# Raises ValueError for an unknown status.
+def parse_status_scope(scope):
+    scope = (scope or 'open').strip()
+    if scope.lower() in STATUS_SCOPES:
+        return list(STATUS_SCOPES[scope.lower()])
+
+    status_by_name = {name.lower(): status for status, name in STATUS_MAPPING.items()}
+    statuses = []
+    for value in scope.split(','):
+        value = value.strip()
+        if value.isdigit() and int(value) in STATUS_MAPPING:
+            status = int(value)
+        elif value.lower() in status_by_name:
+            status = status_by_name[value.lower()]
+        else:
+            raise ValueError(f"Unknown ticket status: {value}")
+        if status not in statuses:
+            statuses.append(status)
+    return statuses
+
+# Function to check that an export format can be written here. Raises ValueError if not.
+def check_export_format(export_format):
+    if export_format not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown export format: {export_format}. Use one of {', '.join(EXPORT_FORMATS)}.")
+    if export_format == 'parquet' and pyarrow is None:
+        raise ValueError("Parquet exports need pyarrow. Install it with: pip install pyarrow")
+
+# Function to split an iterable into lists of at most size items
+def iter_chunks(items, size=DEFAULT_CHUNK_SIZE):
+    items = iter(items)
+    while True:
+        chunk = list(islice(items, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+class TicketSpill:
+    """
+    Temporary SQLite file that takes scored tickets in any order and hands
+    them back in queue order, chunk by chunk. The file is deleted on close().
+    """
+
+    def __init__(self, directory=None):
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+        handle, self.path = tempfile.mkstemp(prefix='fsc_export_', suffix='.sqlite3', dir=directory)
+        os.close(handle)
+        self.count = 0
+        self._connection = sqlite3.connect(self.path, check_same_thread=False)
+        # Scratch data, nothing to recover after a crash
+        self._connection.execute("PRAGMA journal_mode = OFF")
+        self._connection.execute("PRAGMA synchronous = OFF")
+        self._connection.execute("CREATE TABLE spill (neg_score INTEGER, created REAL, id INTEGER, data TEXT NOT NULL)")
+
+    # Function to add a batch of scored tickets
+    def add(self, tickets):
+        rows = [(-(ticket['score'] or 0), parse_timestamp(ticket['created_at']), ticket['id'],
+                 json.dumps(ticket, default=json_default)) for ticket in tickets]
+        self._connection.executemany("INSERT INTO spill VALUES (?, ?, ?, ?)", rows)
+        self.count += len(rows)
+
+    # Function to yield the tickets in queue order, at most chunk_size at a time
+    def iter_sorted(self, chunk_size=DEFAULT_CHUNK_SIZE):
+        self._connection.commit()
+        # Sorting in SQLite spills to disk as needed, so memory stays bounded
+        cursor = self._connection.execute("SELECT data FROM spill ORDER BY neg_score, created, id")
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                return
+            yield [TicketRecord.from_dict(json.loads(data)) for (data,) in rows]
+
+    def close(self):
+        self._connection.close()
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+# Function to put a stream of scored tickets in queue order. Yields chunks of at most chunk_size tickets.
+def iter_sorted_chunks(tickets, chunk_size=DEFAULT_CHUNK_SIZE, directory=None):
+    with TicketSpill(directory) as spill:
+        for chunk in iter_chunks(tickets, chunk_size):
+            spill.add(chunk)
+        yield from spill.iter_sorted(chunk_size)
+
+# Function to encode chunks of tickets as CSV. Yields the header, then one block of bytes per chunk.
+def iter_csv(chunks, fields=TICKET_FIELDS):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(fields)
+    yield buffer.getvalue().encode('utf-8')
+    for chunk in chunks:
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows([ticket[field] for field in fields] for ticket in chunk)
+        yield buffer.getvalue().encode('utf-8')
+
+
+class ChunkBuffer(io.RawIOBase):
+    """
+    Write-only file object that keeps what was written until it is drained,
+    so the Parquet writer's output can be streamed one row group at a time.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._parts = []
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        data = bytes(data)
+        self._parts.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    # Function to return and forget everything written since the last drain
+    def drain(self):
+        data = b''.join(self._parts)
+        self._parts = []
+        return data
+
+
+# Function to return the Parquet schema of the ticket fields
+def parquet_schema():
+    types = {
+        'id': pyarrow.int64(),
+        'priority': pyarrow.string(),
+        'is_past_due': pyarrow.bool_(),
+        'is_fr_past_due': pyarrow.bool_(),
+        'fr_responded': pyarrow.bool_(),
+        'escalated': pyarrow.bool_(),
+        'score': pyarrow.int64(),
+    }
+    return pyarrow.schema([(field, types.get(field, pyarrow.string())) for field in TICKET_FIELDS])
+
+# Function to encode chunks of tickets as Parquet. Yields the bytes of each row group as it is written.
+def iter_parquet(chunks):
+    schema = parquet_schema()
+    sink = ChunkBuffer()
+    writer = pyarrow.parquet.ParquetWriter(sink, schema)
+    try:
+        for chunk in chunks:
+            columns = {field: [ticket[field] for ticket in chunk] for field in TICKET_FIELDS}
+            writer.write_table(pyarrow.Table.from_pydict(columns, schema=schema))
+            yield sink.drain()
+    finally:
+        writer.close()
+    yield sink.drain()
+
+# Function to encode chunks of tickets in the given format. Yields bytes.
+def export_chunks(chunks, export_format='csv'):
+    check_export_format(export_format)
+    if export_format == 'parquet':
+        return iter_parquet(chunks)
+    return iter_csv(chunks)
@@ -0,0 +1,300 @@
+################################################################################
+# fake_freshservice.py is a local stand-in for the FreshService API.
+#
+# - Serves the ticket, department, agent and group endpoints FSC Suite uses
+# - Synthetic data of configurable size
+# - Rate limit headers, 429s and injected latency like the real service
+# - Request counters at /_stats for the benchmarks
+#
+# Run it on its own and start the app in test mode against it:
+#   python -m lib.fake_freshservice --tickets 10000
+#   python app.py -m test
+#
+# Author: Taylor Giddens - taylor.giddens@ingrammicro.com
+# Version: 1.0.3
+################################################################################
+import argparse
+import json
+import random
+import re
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+DEFAULT_PORT = 8100
+DEFAULT_TICKETS = 1000
+DEFAULT_RATE_LIMIT = 5000
+RATE_LIMIT_WINDOW = 60
+MAX_PER_PAGE = 100
+
+OPEN_STATUSES = [2, 3, 6, 7, 8, 9, 10, 11, 12]
+CLOSED_STATUSES = [4, 5]
+TIERS = ['A', 'B', 'C', 'D', 'E', None]
+ENVIRONMENTS = ['Production', 'Lab', None]
+TICKET_TYPES = ['Incident or Problem', 'Service request', None]
+ESCALATED = ['Yes', 'No', None]
+
+
+# Function to format a datetime the way FreshService does
+def format_timestamp(value):
+    return value.strftime('%Y-%m-%dT%H:%M:%SZ')
+
+
+class FakeData:
+    """
+    Synthetic FreshService tenant. Roughly one ticket in ten is closed, so the
+    status filter has something to drop. churn tickets per minute get a new
+    updated_at (and sometimes a new status or priority), which gives the
+    incremental sync something to pick up.
+    """
+
+    def __init__(self, tickets=DEFAULT_TICKETS, departments=300, agents=80, groups=40, churn=0, seed=1):
+        self.random = random.Random(seed)
+        self.churn = churn
+        self.lock = threading.Lock()
+        self.departments = [{'id': i, 'name': f"Company {i}"} for i in range(1, departments + 1)]
+        self.agents = [{'id': i, 'first_name': f"Agent{i}", 'last_name': 'Test', 'email': f"agent{i}@example.com"}
+                       for i in range(1, agents + 1)]
+        self.groups = [{'id': i, 'name': f"Group {i}"} for i in range(1, groups + 1)]
+        self.records = {
+            'departments': {record['id']: record for record in self.departments},
+            'agents': {record['id']: record for record in self.agents},
+            'groups': {record['id']: record for record in self.groups},
+        }
+
+        now = datetime.now(timezone.utc).replace(microsecond=0)
+        # First response times, only sent with include=stats like FreshService does
+        self.first_responses = {}
+        self.tickets = [self.make_ticket(ticket_id, now) for ticket_id in range(1, tickets + 1)]
+        self.last_churn = time.time()
+
+    def make_ticket(self, ticket_id, now):
+        pick = self.random.choice
+        created_at = now - timedelta(minutes=self.random.randint(10, 60 * 24 * 90))
+        fr_hours = self.random.randint(1, 48)
+        fr_due_by = created_at + timedelta(hours=fr_hours)
+        # Most first responses come in before the deadline, some after it and some not yet
+        responded_at = created_at + timedelta(minutes=self.random.randint(5, fr_hours * 75))
+        if responded_at > now or self.random.random() < 0.15:
+            responded_at = None
+        self.first_responses[ticket_id] = format_timestamp(responded_at) if responded_at else None
+        return {
+            'id': ticket_id,
+            'subject': f"Synthetic ticket {ticket_id}",
+            'group_id': pick(self.groups)['id'] if self.random.random() > 0.05 else None,
+            'department_id': pick(self.departments)['id'],
+            'responder_id': pick(self.agents)['id'] if self.random.random() > 0.2 else None,
+            'priority': self.random.randint(1, 4),
+            'status': pick(CLOSED_STATUSES) if self.random.random() < 0.1 else pick(OPEN_STATUSES),
+            'created_at': format_timestamp(created_at),
+            'updated_at': format_timestamp(min(created_at + timedelta(minutes=self.random.randint(0, 600)), now)),
+            'fr_due_by': format_timestamp(fr_due_by),
+            'fr_escalated': fr_due_by <= now and (responded_at is None or responded_at > fr_due_by),
+            'due_by': format_timestamp(now + timedelta(hours=self.random.randint(-72, 24 * 14))),
+            'custom_fields': {
+                'account_tier': pick(TIERS),
+                'environment': pick(ENVIRONMENTS),
+                'ticket_type': pick(TICKET_TYPES),
+                'escalated': pick(ESCALATED),
+            },
+        }
+
+    # Function to touch the tickets that changed since the last request, based on the churn rate
+    def apply_churn(self):
+        with self.lock:
+            elapsed = time.time() - self.last_churn
+            count = int(elapsed * self.churn / 60)
+            if not count:
+                return
+            self.last_churn = time.time()
+            updated_at = format_timestamp(datetime.now(timezone.utc))
+            for ticket in self.random.sample(self.tickets, min(count, len(self.tickets))):
+                ticket['updated_at'] = updated_at
+                if self.first_responses[ticket['id']] is None:
+                    self.first_responses[ticket['id']] = updated_at
+                roll = self.random.random()
+                if roll < 0.2:
+                    ticket['status'] = self.random.choice(CLOSED_STATUSES)
+                elif roll < 0.5:
+                    ticket['priority'] = self.random.randint(1, 4)
+
+    def filter_tickets(self, statuses):
+        with self.lock:
+            return [ticket for ticket in self.tickets if ticket['status'] in statuses]
+
+    def tickets_updated_since(self, updated_since, include_stats=False):
+        with self.lock:
+            tickets = [ticket for ticket in self.tickets if ticket['updated_at'] >= updated_since]
+            if include_stats:
+                tickets = [{**ticket, 'stats': {'first_responded_at': self.first_responses[ticket['id']]}} for ticket in tickets]
+            return tickets
+
+
+class FakeFreshService:
+    """
+    Threaded HTTP server around FakeData with a per-minute rate limit.
+
+    Every response carries X-Ratelimit-Total and X-Ratelimit-Remaining. When
+    the budget for the current minute is used up, requests get a 429 with
+    Retry-After until the window resets. error_rate adds random 429s on top,
+    and latency (plus up to jitter seconds) is added to every request.
+    """
+
+    def __init__(self, data, port=DEFAULT_PORT, host='127.0.0.1', latency=0.0, jitter=0.0,
+                 rate_limit=DEFAULT_RATE_LIMIT, error_rate=0.0):
+        self.data = data
+        self.latency = latency
+        self.jitter = jitter
+        self.rate_limit = rate_limit
+        self.error_rate = error_rate
+        self.window_started = time.time()
+        self.window_used = 0
+        self.stats = {}
+        self.lock = threading.Lock()
+        self.server = ThreadingHTTPServer((host, port), self.make_handler())
+        self.server.daemon_threads = True
+        self.thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, name='fake-freshservice', daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    # Function to count a request against the rate limit. Returns (allowed, remaining, retry_after).
+    def take_rate_limit(self):
+        with self.lock:
+            now = time.time()
+            if now - self.window_started >= RATE_LIMIT_WINDOW:
+                self.window_started = now
+                self.window_used = 0
+            retry_after = max(1, int(self.window_started + RATE_LIMIT_WINDOW - now) + 1)
+            if self.window_used >= self.rate_limit:
+                return False, 0, retry_after
+            self.window_used += 1
+            return True, self.rate_limit - self.window_used, retry_after
+
+    def count(self, key):
+        with self.lock:
+            entry = self.stats.setdefault(key, {'count': 0, 'first': time.time(), 'last': None})
+            entry['count'] += 1
+            entry['last'] = time.time()
+
+    def snapshot_stats(self, reset=False):
+        with self.lock:
+            stats = {key: dict(value) for key, value in self.stats.items()}
+            if reset:
+                self.stats = {}
+        return stats
+
+    # Function to answer one API request. Returns (status, body, extra headers).
+    def route(self, path, query):
+        page = int(query.get('page', ['1'])[0])
+        per_page = min(int(query.get('per_page', ['30'])[0]), MAX_PER_PAGE)
+        start = (page - 1) * per_page
+
+        if path == '/api/v2/tickets/filter':
+            self.data.apply_churn()
+            statuses = [int(status) for status in re.findall(r'status:\s*(\d+)', query.get('query', [''])[0])]
+            tickets = self.data.filter_tickets(statuses or OPEN_STATUSES)
+            return 200, {'tickets': tickets[start:start + per_page], 'total': len(tickets)}, 'tickets/filter'
+
+        if path == '/api/v2/tickets':
+            self.data.apply_churn()
+            updated_since = query.get('updated_since', [''])[0]
+            tickets = self.data.tickets_updated_since(updated_since, 'stats' in query.get('include', [''])[0])
+            return 200, {'tickets': tickets[start:start + per_page]}, 'tickets'
+
+        match = re.fullmatch(r'/api/v2/(departments|agents|groups)(?:/(\d+))?', path)
+        if match:
+            entity, record_id = match.groups()
+            if record_id is None:
+                records = getattr(self.data, entity)
+                return 200, {entity: records[start:start + per_page]}, entity
+            record = self.data.records[entity].get(int(record_id))
+            if record is None:
+                return 404, {'code': 'access_denied', 'message': 'Record not found'}, f"{entity}/id"
+            return 200, {entity[:-1]: record}, f"{entity}/id"
+
+        return 404, {'message': 'Not found'}, 'unknown'
+
+    def make_handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                query = parse_qs(url.query)
+
+                if url.path == '/_stats':
+                    self.send_json(200, fake.snapshot_stats(reset='reset' in query))
+                    return
+
+                if fake.latency or fake.jitter:
+                    time.sleep(fake.latency + random.random() * fake.jitter)
+
+                allowed, remaining, retry_after = fake.take_rate_limit()
+                headers = {'X-Ratelimit-Total': str(fake.rate_limit), 'X-Ratelimit-Remaining': str(remaining)}
+                if not allowed or random.random() < fake.error_rate:
+                    fake.count('429')
+                    headers['Retry-After'] = str(retry_after if not allowed else 1)
+                    self.send_json(429, {'message': 'You have exceeded the limit of requests per minute'}, headers)
+                    return
+
+                status, body, key = fake.route(url.path, query)
+                fake.count(key)
+                self.send_json(status, body, headers)
+
+            def send_json(self, status, body, headers=None):
+                encoded = json.dumps(body).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(encoded)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(encoded)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description='Local stand-in for the FreshService API, used by test mode and the benchmarks.')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT, help='Port to listen on.')
+    parser.add_argument('--tickets', type=int, default=DEFAULT_TICKETS, help='Number of synthetic tickets.')
+    parser.add_argument('--departments', type=int, default=300, help='Number of synthetic departments (companies).')
+    parser.add_argument('--agents', type=int, default=80, help='Number of synthetic agents.')
+    parser.add_argument('--groups', type=int, default=40, help='Number of synthetic groups.')
+    parser.add_argument('--churn', type=int, default=0, help='Tickets updated per minute.')
+    parser.add_argument('--latency', type=float, default=0.0, help='Seconds added to every request.')
+    parser.add_argument('--jitter', type=float, default=0.0, help='Up to this many extra seconds added at random.')
+    parser.add_argument('--rate-limit', type=int, default=DEFAULT_RATE_LIMIT, help='Requests allowed per minute.')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Share of requests answered with a random 429.')
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_arguments()
+    data = FakeData(args.tickets, args.departments, args.agents, args.groups, args.churn)
+    fake = FakeFreshService(data, args.port, latency=args.latency, jitter=args.jitter,
+                            rate_limit=args.rate_limit, error_rate=args.error_rate)
+    print(f"Fake FreshService with {args.tickets} tickets listening on {fake.base_url}")
+    try:
+        fake.server.serve_forever()
+    except KeyboardInterrupt:
+        fake.stop()
@@ -0,0 +1,146 @@
+################################################################################
+# logs.py sets up logging so that disk and terminal writes stay off the
+# threads that fetch pages and score tickets.
+#
+# - Every record goes through a queue to a single listener thread
+# - One log file per process, rotated by size and at midnight
+# - Console progress lines rate-limited, with milestones always shown
+#
+# Author: Taylor Giddens - taylor.giddens@ingrammicro.com
+# Version: 1.0.3
+################################################################################
+import atexit
+import logging
+import os
+import queue
+import sys
+import threading
+import time
+from datetime import date
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+LOG_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+CONSOLE_FORMAT = '%(asctime)s - %(message)s'
+CONSOLE_DATE_FORMAT = '%Y-%m-%d %H:%M:%S'
+LOG_MAX_BYTES = 10 * 1024 * 1024
+LOG_BACKUP_COUNT = 7
+DEFAULT_PROGRESS_INTERVAL = 1.0
+
+# Logger for the lines shown in the terminal while the app runs
+CONSOLE_LOGGER_NAME = 'fsc.console'
+
+_listener = None
+
+
+class DailyRotatingFileHandler(RotatingFileHandler):
+    """
+    RotatingFileHandler that also rolls the file over on the first record
+    of a new day, so each backup holds at most one day or max_bytes.
+    """
+
+    def __init__(self, filename, max_bytes=LOG_MAX_BYTES, backup_count=LOG_BACKUP_COUNT):
+        super().__init__(filename, maxBytes=max_bytes, backupCount=backup_count, encoding='utf-8')
+        self._day = self._file_day()
+
+    def _file_day(self):
+        try:
+            return date.fromtimestamp(os.path.getmtime(self.baseFilename))
+        except OSError:
+            return date.today()
+
+    def shouldRollover(self, record):
+        if date.fromtimestamp(record.created) != self._day:
+            return True
+        return super().shouldRollover(record)
+
+    def doRollover(self):
+        super().doRollover()
+        self._day = date.today()
+
+
+class DeferredQueueHandler(QueueHandler):
+    """
+    QueueHandler that hands the record over untouched. The stock handler
+    formats the message in the logging thread so the record can be pickled;
+    the listener here runs in the same process, so formatting is left to it.
+    Log arguments must therefore not be changed after the call.
+    """
+
+    def prepare(self, record):
+        return record
+
+
+# Filter that keeps console progress lines out of the log file
+class ExcludeConsoleFilter(logging.Filter):
+    def filter(self, record):
+        return not record.name.startswith(CONSOLE_LOGGER_NAME)
+
+
+# Function to route every log record through a queue to a listener thread. Returns the log file path.
+def configure_logging(log_path, level=logging.INFO, max_bytes=LOG_MAX_BYTES, backup_count=LOG_BACKUP_COUNT, console_stream=None):
+    global _listener
+    stop_logging()
+
+    file_handler = DailyRotatingFileHandler(str(log_path), max_bytes, backup_count)
+    file_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+    file_handler.addFilter(ExcludeConsoleFilter())
+
+    console_handler = logging.StreamHandler(console_stream or sys.stdout)
+    console_handler.setFormatter(logging.Formatter(CONSOLE_FORMAT, CONSOLE_DATE_FORMAT))
+    console_handler.addFilter(logging.Filter(CONSOLE_LOGGER_NAME))
+
+    # The queue is unbounded so a slow disk never blocks the thread that logs
+    records = queue.SimpleQueue()
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+        handler.close()
+    root.addHandler(DeferredQueueHandler(records))
+    root.setLevel(level)
+
+    console_logger = logging.getLogger(CONSOLE_LOGGER_NAME)
+    console_logger.setLevel(logging.INFO)
+
+    _listener = QueueListener(records, file_handler, console_handler, respect_handler_level=True)
+    _listener.start()
+    atexit.register(stop_logging)
+    return log_path
+
+# Function to flush the queue and stop the listener thread
+def stop_logging():
+    global _listener
+    if _listener is not None:
+        listener, _listener = _listener, None
+        listener.stop()
+        for handler in listener.handlers:
+            handler.close()
+
+
+class ConsoleProgress:
+    """
+    Progress lines for the terminal. update() shows at most one line every
+    interval seconds and drops the rest, done() is always shown. Lines are
+    formatted by the listener thread, only when they are actually shown.
+    """
+
+    def __init__(self, interval=DEFAULT_PROGRESS_INTERVAL):
+        self.interval = interval
+        self._logger = logging.getLogger(CONSOLE_LOGGER_NAME)
+        self._lock = threading.Lock()
+        self._last_shown = 0.0
+
+    def update(self, message, *args):
+        now = time.monotonic()
+        with self._lock:
+            if now - self._last_shown < self.interval:
+                return
+            self._last_shown = now
+        self._logger.info(message, *args)
+
+    def done(self, message, *args):
+        with self._lock:
+            self._last_shown = 0.0
+        self._logger.info(message, *args)
+
+
+console_progress = ConsoleProgress()
@@ -0,0 +1,215 @@
+################################################################################
+# metrics.py collects counters, gauges and timing histograms for /metrics.
+#
+# - Prometheus text exposition format, no client library needed
+# - Each update is a dict lookup and an addition under a lock, cheap enough
+#   to leave on in production
+# - Every metric the app records is defined here, in one place
+#
+# Author: Taylor Giddens - taylor.giddens@ingrammicro.com
+# Version: 1.0.3
+################################################################################
+import re
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+# Upper bounds in seconds, from a fast in-memory stage to a slow full crawl
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+
+class Metric:
+    """
+    Base class for a named metric with optional labels. Values are kept per
+    tuple of label values, so labels(...) returns a cheap bound view rather
+    than a new object for every call.
+    """
+
+    kind = None
+
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+        REGISTRY.register(self)
+
+    def labels(self, *labelvalues):
+        if len(labelvalues) != len(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}")
+        return BoundMetric(self, tuple(str(value) for value in labelvalues))
+
+    def format_labels(self, labelvalues, extra=()):
+        pairs = list(zip(self.labelnames, labelvalues)) + list(extra)
+        if not pairs:
+            return ''
+        escaped = (f'{name}="{escape_label(value)}"' for name, value in pairs)
+        return '{' + ','.join(escaped) + '}'
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self.samples())
+        return lines
+
+
+class BoundMetric:
+    def __init__(self, metric, labelvalues):
+        self.metric = metric
+        self.labelvalues = labelvalues
+
+    def inc(self, amount=1):
+        self.metric.inc(amount, self.labelvalues)
+
+    def set(self, value):
+        self.metric.set(value, self.labelvalues)
+
+    def observe(self, value):
+        self.metric.observe(value, self.labelvalues)
+
+    def time(self):
+        return self.metric.time(self.labelvalues)
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, labelvalues=()):
+        with self._lock:
+            self._values[labelvalues] = self._values.get(labelvalues, 0) + amount
+
+    # Function to return the sum over every label combination
+    def total(self):
+        with self._lock:
+            return sum(self._values.values())
+
+    def samples(self):
+        with self._lock:
+            values = dict(self._values)
+        return [f"{self.name}{self.format_labels(labels)} {format_value(value)}" for labels, value in sorted(values.items())]
+
+
+class Gauge(Metric):
+    """
+    Gauge set directly with set(), or read from a function at scrape time
+    with set_function() for values that are cheaper to look up than to track.
+    """
+
+    kind = 'gauge'
+
+    def __init__(self, name, help_text, labelnames=()):
+        super().__init__(name, help_text, labelnames)
+        self._function = None
+
+    def set(self, value, labelvalues=()):
+        with self._lock:
+            self._values[labelvalues] = value
+
+    def inc(self, amount=1, labelvalues=()):
+        with self._lock:
+            self._values[labelvalues] = self._values.get(labelvalues, 0) + amount
+
+    def set_function(self, function):
+        self._function = function
+
+    def samples(self):
+        if self._function is not None:
+            value = self._function()
+            return [] if value is None else [f"{self.name} {format_value(value)}"]
+        with self._lock:
+            values = dict(self._values)
+        return [f"{self.name}{self.format_labels(labels)} {format_value(value)}" for labels, value in sorted(values.items())]
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, labelvalues=()):
+        position = bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(labelvalues)
+            if entry is None:
+                entry = self._values[labelvalues] = [[0] * (len(self.buckets) + 1), 0, 0.0]
+            entry[0][position] += 1
+            entry[1] += 1
+            entry[2] += value
+
+    @contextmanager
+    def time(self, labelvalues=()):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, labelvalues)
+
+    def samples(self):
+        with self._lock:
+            values = {labels: ([*entry[0]], entry[1], entry[2]) for labels, entry in self._values.items()}
+        lines = []
+        for labels, (counts, count, total) in sorted(values.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + ('+Inf',), counts):
+                cumulative += bucket_count
+                lines.append(f"{self.name}_bucket{self.format_labels(labels, [('le', format_value(bound))])} {cumulative}")
+            lines.append(f"{self.name}_count{self.format_labels(labels)} {count}")
+            lines.append(f"{self.name}_sum{self.format_labels(labels)} {format_value(total)}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+
+    # Function to render every metric in the Prometheus text format
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+def format_value(value):
+    if isinstance(value, str):
+        return value
+    if isinstance(value, bool):
+        return '1' if value else '0'
+    if isinstance(value, int):
+        return str(value)
+    return repr(float(value))
+
+def escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+# Function to turn an API URL into a low-cardinality endpoint label, e.g. agents/:id
+def endpoint_label(url):
+    path = url.split('?', 1)[0]
+    path = path.split('/api/v2/', 1)[-1]
+    return re.sub(r'/\d+(?=/|$)', '/:id', path)
+
+
+REGISTRY = Registry()
+
+# FreshService API
+API_REQUESTS = Counter('fsc_api_requests_total', 'FreshService API requests by endpoint and status code.', ['endpoint', 'status'])
+API_REQUEST_SECONDS = Histogram('fsc_api_request_seconds', 'FreshService API request latency.', ['endpoint'])
+API_RETRIES = Counter('fsc_api_retries_total', 'FreshService API requests retried, by reason.', ['reason'])
+API_RATE_LIMITED = Counter('fsc_api_rate_limited_total', 'FreshService API responses with status 429.')
+RATELIMIT_REMAINING = Gauge('fsc_api_ratelimit_remaining', 'Last X-Ratelimit-Remaining value sent by FreshService.')
+
+# Refresh pipeline
+STAGE_SECONDS = Histogram('fsc_stage_seconds', 'Time spent in each refresh and serving stage.', ['stage'])
+REFRESHES = Counter('fsc_refreshes_total', 'Ticket refreshes by sync type and result.', ['sync', 'result'])
+REFRESH_API_CALLS = Gauge('fsc_refresh_api_calls', 'FreshService API calls made by the last refresh.')
+
+# Snapshot
+SNAPSHOT_TICKETS = Gauge('fsc_snapshot_tickets', 'Tickets in the current snapshot.')
+SNAPSHOT_AGE = Gauge('fsc_snapshot_age_seconds', 'Seconds since the snapshot was last refreshed.')
+SNAPSHOT_VERSION = Gauge('fsc_snapshot_version', 'Current snapshot version.')
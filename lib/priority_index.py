@@ -0,0 +1,92 @@
+################################################################################
+# priority_index.py keeps the ticket queue order between refreshes.
+#
+# - Ordered index keyed by (-score, created_at, id)
+# - Single-ticket inserts, updates and removals without a full re-sort
+# - Rank ("what position is ticket X") and top-k queries
+#
+# Author: Taylor Giddens - taylor.giddens@ingrammicro.com
+# Version: 1.0.3
+################################################################################
+from bisect import bisect_left, insort
+from itertools import islice
+from lib.scoring import parse_timestamp
+
+try:
+    from sortedcontainers import SortedList
+except ImportError:  # sortedcontainers is optional, a plain sorted list is used without it
+    SortedList = None
+
+
+class PriorityIndex:
+    """
+    Ticket IDs in queue order: highest score first, then oldest first, with
+    the ticket ID breaking any remaining tie.
+
+    With sortedcontainers installed every update and rank lookup is
+    O(log n). Without it the index falls back to a sorted Python list: rank
+    lookups are still O(log n) binary searches, while inserts and removals
+    pay an O(n) memmove.
+    """
+
+    def __init__(self, tickets=()):
+        self._key_by_id = {}
+        self._keys = SortedList() if SortedList is not None else []
+        self.rebuild(tickets)
+
+    @staticmethod
+    def make_key(ticket):
+        return (-ticket['score'], parse_timestamp(ticket['created_at']), ticket['id'])
+
+    # Function to replace the whole index, used after a full crawl
+    def rebuild(self, tickets):
+        self._key_by_id = {ticket['id']: self.make_key(ticket) for ticket in tickets}
+        keys = sorted(self._key_by_id.values())
+        self._keys = SortedList(keys) if SortedList is not None else keys
+
+    # Function to insert a ticket or move it to its new position
+    def upsert(self, ticket):
+        key = self.make_key(ticket)
+        previous = self._key_by_id.get(ticket['id'])
+        if previous == key:
+            return
+        if previous is not None:
+            self._discard_key(previous)
+        self._key_by_id[ticket['id']] = key
+        if SortedList is not None:
+            self._keys.add(key)
+        else:
+            insort(self._keys, key)
+
+    def remove(self, ticket_id):
+        key = self._key_by_id.pop(ticket_id, None)
+        if key is not None:
+            self._discard_key(key)
+
+    def _discard_key(self, key):
+        if SortedList is not None:
+            self._keys.remove(key)
+        else:
+            del self._keys[bisect_left(self._keys, key)]
+
+    # Function to return the zero-based queue position of a ticket, or None if it is not queued
+    def rank(self, ticket_id):
+        key = self._key_by_id.get(ticket_id)
+        if key is None:
+            return None
+        if SortedList is not None:
+            return self._keys.index(key)
+        return bisect_left(self._keys, key)
+
+    # Function to return the IDs of the first k tickets in the queue
+    def top(self, k):
+        return [key[2] for key in islice(self._keys, k)]
+
+    def __iter__(self):
+        return (key[2] for key in self._keys)
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __contains__(self, ticket_id):
+        return ticket_id in self._key_by_id
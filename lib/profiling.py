@@ -0,0 +1,162 @@
+################################################################################
+# profiling.py profiles ticket refreshes on demand.
+#
+# - cProfile of the thread running the refresh, saved as a .pstats file
+# - Stack samples of that thread and the page fetch workers, saved as
+#   folded stacks for flamegraph.pl or speedscope
+# - Top functions written to the log after every profile
+#
+# Author: Taylor Giddens - taylor.giddens@ingrammicro.com
+# Version: 1.0.3
+################################################################################
+import cProfile
+import io
+import logging
+import os
+import pstats
+import sys
+import threading
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+
+DEFAULT_TOP = 25
+DEFAULT_SAMPLE_INTERVAL = 0.005
+
+# Threads sampled besides the one being profiled: the FreshService page fetch workers
+SAMPLED_THREAD_PREFIXES = ('fs-fetch',)
+
+
+class StackSampler:
+    """
+    Background thread that records the call stack of the watched threads
+    every interval seconds. cProfile only sees the thread that enabled it,
+    the sampler also covers the page fetches (network waits and JSON
+    decoding) that run on the fetch workers.
+    """
+
+    def __init__(self, thread_id, interval=DEFAULT_SAMPLE_INTERVAL, prefixes=SAMPLED_THREAD_PREFIXES):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.prefixes = prefixes
+        self.samples = Counter()
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='profile-sampler', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self):
+        while not self._stop_event.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                name = names.get(thread_id, '')
+                if thread_id != self.thread_id and not name.startswith(self.prefixes):
+                    continue
+                # A pool thread waiting in _worker itself is idle, not fetching
+                if thread_id != self.thread_id and frame.f_code.co_name == '_worker':
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                # Pool threads are numbered, drop the number so they fold into one root
+                stack.append(name.rsplit('_', 1)[0] if name.startswith(self.prefixes) else name)
+                self.samples[';'.join(reversed(stack))] += 1
+
+    # Function to write the samples in the folded stack format: "root;caller;callee count" per line
+    def write_folded(self, path):
+        with open(path, 'w', encoding='utf-8') as folded_file:
+            for stack, count in self.samples.most_common():
+                folded_file.write(f"{stack} {count}\n")
+
+    # Function to return the functions seen most often at the top of a stack, as (function, samples) pairs
+    def top_functions(self, top=DEFAULT_TOP):
+        leaves = Counter()
+        for stack, count in self.samples.items():
+            leaves[stack.rsplit(';', 1)[-1]] += count
+        return leaves.most_common(top)
+
+
+class ProfileResult:
+    def __init__(self, name):
+        self.name = name
+        self.pstats_path = None
+        self.folded_path = None
+
+
+# Only one cProfile can be enabled at a time (Python 3.12+ refuses a second), so profiles take turns
+_profile_lock = threading.Lock()
+
+
+class RefreshProfiler:
+    """
+    Profiles a block of code with cProfile and the stack sampler, then saves
+    both profiles to directory and logs the hottest functions. One profile
+    runs at a time: a block that starts while another profile is running,
+    on any thread, runs unprofiled and the skip is logged.
+    """
+
+    def __init__(self, directory, top=DEFAULT_TOP, sample_interval=DEFAULT_SAMPLE_INTERVAL):
+        self.directory = Path(directory)
+        self.top = top
+        self.sample_interval = sample_interval
+        self._local = threading.local()
+
+    # Function to profile the body of a with block. Yields a ProfileResult that has its paths once the block ends.
+    @contextmanager
+    def profile(self, label):
+        result = ProfileResult(f"{datetime.now().strftime('%Y%m%d-%H%M%S-%f')}-{label}-{os.getpid()}")
+        if getattr(self._local, 'active', False):
+            # Already inside a profile on this thread (e.g. a profiled request running a profiled refresh)
+            yield result
+            return
+        if not _profile_lock.acquire(blocking=False):
+            logging.info(f"Another profile is running. Running the {label} without profiling it.")
+            yield result
+            return
+        self._local.active = True
+        sampler = StackSampler(threading.get_ident(), self.sample_interval)
+        profiler = cProfile.Profile()
+        try:
+            sampler.start()
+            try:
+                profiler.enable()
+            except ValueError as e:  # A profiling tool outside this app is active (e.g. a debugger)
+                logging.warning(f"Could not profile the {label}: {e}. Running it without profiling it.")
+                profiler = None
+            yield result
+        finally:
+            if profiler is not None:
+                profiler.disable()
+            sampler.stop()
+            self._local.active = False
+            _profile_lock.release()
+            if profiler is not None:
+                try:
+                    self.save(result, profiler, sampler)
+                except OSError as e:
+                    logging.warning(f"Could not save the {label} profile: {e}")
+
+    def save(self, result, profiler, sampler):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        result.pstats_path = self.directory / f"{result.name}.pstats"
+        result.folded_path = self.directory / f"{result.name}.folded"
+        profiler.dump_stats(str(result.pstats_path))
+        sampler.write_folded(result.folded_path)
+
+        summary = io.StringIO()
+        stats = pstats.Stats(profiler, stream=summary)
+        stats.sort_stats('cumulative').print_stats(self.top)
+        logging.info(f"Profile {result.name} saved to {result.pstats_path} and {result.folded_path}. "
+                     f"Top {self.top} functions by cumulative time:\n{summary.getvalue()}")
+        sampled = '\n'.join(f"{count:>8}  {function}" for function, count in sampler.top_functions(self.top))
+        logging.info(f"Profile {result.name}: top {self.top} functions by samples, including page fetch workers:\n{sampled}")
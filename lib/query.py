@@ -0,0 +1,117 @@
+################################################################################
+# query.py filters, projects and pages the sorted ticket list for /tickets.
+#
+# - In-memory indexes built once per snapshot version
+# - Same filter categories as the dashboard's filter dropdown
+#
+# Author: Taylor Giddens - taylor.giddens@ingrammicro.com
+# Version: 1.0.3
+################################################################################
+
+# Query parameter -> ticket field. The names match the dashboard filter categories.
+FILTER_FIELDS = {
+    'company': 'company_name',
+    'group': 'group_name',
+    'agent': 'agent_name',
+    'agent_email': 'agent_email',
+    'tier': 'account_tier',
+    'priority': 'priority',
+    'status': 'status',
+    'type': 'ticket_type',
+    'environment': 'environment',
+    'escalated': 'escalated',
+    'overdue': 'is_past_due',
+}
+
+BOOLEAN_FIELDS = {'escalated', 'is_past_due'}
+
+
+class QueryError(ValueError):
+    pass
+
+
+class TicketIndex:
+    """
+    Maps each filterable field value to the positions of the matching tickets
+    in the sorted list. Positions are kept in ascending order, so filtered
+    results come back in queue order without sorting again.
+    """
+
+    def __init__(self, tickets):
+        self.tickets = tickets
+        self.fields = {}
+        for field in FILTER_FIELDS.values():
+            values = {}
+            for position, ticket in enumerate(tickets):
+                values.setdefault(ticket.get(field), []).append(position)
+            self.fields[field] = values
+
+    # Function to return the positions matching every filter. filters maps field -> list of accepted values.
+    def match(self, filters):
+        if not filters:
+            return range(len(self.tickets))
+
+        matches = None
+        # Start with the most selective field so the intersections stay small
+        candidates = []
+        for field, values in filters.items():
+            positions = set()
+            for value in values:
+                positions.update(self.fields[field].get(value, ()))
+            candidates.append(positions)
+        for positions in sorted(candidates, key=len):
+            matches = positions if matches is None else matches & positions
+            if not matches:
+                break
+        return sorted(matches)
+
+
+# Function to convert a query string value to the value stored on the ticket.
+# Errors name the query parameter the client sent, not the ticket field behind it.
+def parse_filter_value(parameter, field, value):
+    if field in BOOLEAN_FIELDS:
+        lowered = value.lower()
+        if lowered in ('yes', 'true', '1'):
+            return True
+        if lowered in ('no', 'false', '0'):
+            return False
+        raise QueryError(f"Invalid value '{value}' for {parameter}. Use Yes or No.")
+    return value
+
+# Function to read the filters, projection and paging options from the request arguments
+def parse_ticket_query(request_args):
+    filters = {}
+    for parameter, field in FILTER_FIELDS.items():
+        values = request_args.getlist(parameter)
+        if values:
+            filters[field] = [parse_filter_value(parameter, field, value) for value in values]
+
+    fields = None
+    if request_args.get('fields'):
+        fields = [field.strip() for field in request_args['fields'].split(',') if field.strip()]
+
+    try:
+        offset = int(request_args.get('offset', 0))
+        limit = request_args.get('limit')
+        limit = int(limit) if limit is not None else None
+    except ValueError:
+        raise QueryError("limit and offset must be whole numbers.")
+    if offset < 0 or (limit is not None and limit < 0):
+        raise QueryError("limit and offset cannot be negative.")
+
+    return filters, fields, offset, limit
+
+# Function to apply a parsed query. Returns (page of tickets, total matching tickets).
+def run_ticket_query(index, filters, fields, offset, limit):
+    positions = index.match(filters)
+    total = len(positions)
+    end = total if limit is None else offset + limit
+    page = [index.tickets[position] for position in positions[offset:end]]
+
+    if fields:
+        known_fields = index.tickets[0] if index.tickets else {}
+        unknown = [field for field in fields if known_fields and field not in known_fields]
+        if unknown:
+            raise QueryError(f"Unknown fields: {', '.join(unknown)}")
+        page = [{field: ticket.get(field) for field in fields} for ticket in page]
+    return page, total
@@ -0,0 +1,102 @@
+################################################################################
+# records.py defines the compact in-memory ticket record.
+#
+# - One slotted object per ticket instead of a 17-key dict
+# - Repeated names and categories interned, so every ticket shares one copy
+# - Reads like a dict and serializes to the same JSON fields, minus the redundant sort_key
+#
+# Author: Taylor Giddens - taylor.giddens@ingrammicro.com
+# Version: 1.0.3
+################################################################################
+import sys
+from collections.abc import Mapping
+
+# Ticket fields, in the order they are serialized
+TICKET_FIELDS = (
+    'id', 'subject', 'group_name', 'company_name', 'priority', 'status',
+    'created_at', 'updated_at', 'fr_due_by', 'due_by', 'is_past_due', 'is_fr_past_due', 'fr_responded',
+    'agent_name', 'agent_email', 'account_tier', 'environment', 'escalated', 'ticket_type',
+    'score',
+)
+
+# Fields that repeat the same few hundred values across the whole queue
+INTERNED_FIELDS = frozenset((
+    'group_name', 'company_name', 'priority', 'status', 'agent_name', 'agent_email',
+    'account_tier', 'environment', 'ticket_type',
+))
+
+FIELD_SET = frozenset(TICKET_FIELDS)
+
+
+class TicketRecord(Mapping):
+    """
+    Slotted ticket record that behaves like a read-mostly dict.
+
+    ticket['field'], ticket.get(), `in`, keys(), items() and dict(ticket)
+    all work as they did on the plain dicts. Fields can be assigned with
+    ticket['field'] = value while a ticket is being built, but published
+    tickets are shared between snapshots, so changes after that go through
+    copy(). The keys are exactly the serialized fields.
+    """
+
+    __slots__ = TICKET_FIELDS
+
+    def __init__(self, **values):
+        for field in TICKET_FIELDS:
+            self[field] = values.get(field)
+
+    # Function to build a record from a ticket dict, ignoring unknown keys such as a stored sort_key
+    @classmethod
+    def from_dict(cls, values):
+        return cls(**values)
+
+    def __getitem__(self, key):
+        if key not in FIELD_SET:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __setitem__(self, key, value):
+        if key not in FIELD_SET:
+            raise KeyError(key)
+        if key in INTERNED_FIELDS and type(value) is str:
+            value = sys.intern(value)
+        setattr(self, key, value)
+
+    def __contains__(self, key):
+        return key in FIELD_SET
+
+    def __iter__(self):
+        return iter(TICKET_FIELDS)
+
+    def __len__(self):
+        return len(TICKET_FIELDS)
+
+    def __eq__(self, other):
+        if isinstance(other, TicketRecord):
+            return all(getattr(self, field) == getattr(other, field) for field in TICKET_FIELDS)
+        return Mapping.__eq__(self, other)
+
+    __hash__ = None
+
+    def __repr__(self):
+        return f"TicketRecord({self.to_dict()!r})"
+
+    # Function to return a new record with some fields changed
+    def copy(self, **changes):
+        record = TicketRecord.__new__(TicketRecord)
+        for field in TICKET_FIELDS:
+            setattr(record, field, getattr(self, field))
+        for field, value in changes.items():
+            record[field] = value
+        return record
+
+    # Function to return the record as a plain dict, in the JSON shape the dashboard expects
+    def to_dict(self):
+        return {field: getattr(self, field) for field in TICKET_FIELDS}
+
+
+# Function used as json.dumps(default=...) so ticket records serialize like dicts
+def json_default(value):
+    if isinstance(value, TicketRecord):
+        return value.to_dict()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
@@ -0,0 +1,99 @@
+################################################################################
+# reference_cache.py keeps FreshService reference data between refreshes.
+#
+# - Departments, agents and groups with per-entity TTLs
+# - Persisted in the local ticket store so it survives restarts
+# - Single-record lookups for IDs missing from a cached directory
+#
+# Author: Taylor Giddens - taylor.giddens@ingrammicro.com
+# Version: 1.0.3
+################################################################################
+import logging
+import threading
+import time
+
+
+class ReferenceCache:
+    """
+    TTL cache for the departments, agents and groups directories.
+
+    Each directory is crawled in full only when its TTL has expired. IDs that
+    show up on tickets but are not in a cached directory are fetched one at a
+    time through lookup(), and IDs that FreshService does not know about are
+    remembered until the directory TTL expires so they are not requested on
+    every refresh.
+    """
+
+    def __init__(self, store, ttls):
+        self.store = store
+        self.ttls = ttls
+        self.entries = {}
+        self._missing = {}
+        self._lock = threading.RLock()
+        self.load()
+
+    # Function to read the cached directories, ignoring them if the store cannot be read
+    def load(self):
+        try:
+            self.entries = self.store.load_references()
+        except Exception as e:
+            logging.warning(f"Could not read reference cache: {e}")
+
+    # Function to write one cached directory
+    def save_directory(self, entity):
+        with self._lock:
+            entry = self.entries[entity]
+            fetched_at, records = entry['fetched_at'], dict(entry['records'])
+        try:
+            self.store.save_directory(entity, fetched_at, records)
+        except Exception as e:
+            logging.warning(f"Could not write reference cache: {e}")
+
+    # Function to write a single record fetched on a cache miss
+    def save_record(self, entity, record_id, value):
+        try:
+            self.store.save_reference(entity, record_id, value)
+        except Exception as e:
+            logging.warning(f"Could not write reference cache: {e}")
+
+    def is_fresh(self, entity):
+        entry = self.entries.get(entity)
+        return entry is not None and time.time() - entry['fetched_at'] < self.ttls[entity]
+
+    # Function to return a full directory, crawling it only when the TTL has expired
+    def get_directory(self, entity, fetch_all):
+        with self._lock:
+            if self.is_fresh(entity):
+                return self.entries[entity]['records']
+
+        logging.info(f"Reference cache for {entity} expired. Fetching the full directory.")
+        records = fetch_all()
+        with self._lock:
+            self.entries[entity] = {'fetched_at': time.time(), 'records': records}
+            self._missing = {key: value for key, value in self._missing.items() if key[0] != entity}
+        self.save_directory(entity)
+        return records
+
+    # Function to fetch a single record that is not in the cached directory
+    def lookup(self, entity, record_id, fetch_one):
+        if record_id is None:
+            return None
+
+        with self._lock:
+            entry = self.entries.setdefault(entity, {'fetched_at': 0, 'records': {}})
+            if record_id in entry['records']:
+                return entry['records'][record_id]
+            missed_at = self._missing.get((entity, record_id))
+            if missed_at is not None and time.time() - missed_at < self.ttls[entity]:
+                return None
+
+        logging.info(f"ID {record_id} not found in cached {entity}. Fetching the single record.")
+        value = fetch_one(record_id)
+        with self._lock:
+            if value is None:
+                self._missing[(entity, record_id)] = time.time()
+            else:
+                entry['records'][record_id] = value
+        if value is not None:
+            self.save_record(entity, record_id, value)
+        return value
@@ -0,0 +1,170 @@
+################################################################################
+# scheduler.py decides when and how many FreshService requests run at once.
+#
+# - Token bucket fed from the X-Ratelimit-* response headers
+# - Worker pool that fetches paginated endpoints in parallel
+#
+# Author: Taylor Giddens - taylor.giddens@ingrammicro.com
+# Version: 1.0.3
+################################################################################
+import logging
+import math
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+DEFAULT_WORKERS = 4
+DEFAULT_TIME_WAIT = 200  # Milliseconds between API calls
+RATE_LIMIT_WINDOW = 60  # FreshService rate limits are per minute
+LOW_REMAINING_CALLS = 40
+PAGES_IN_FLIGHT_PER_WORKER = 2  # Pages requested ahead of the one being processed, per worker
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+class TokenBucket:
+    """
+    Token bucket that paces API calls.
+
+    The base rate comes from --time-wait. Every response adjusts the rate so
+    the calls left in X-Ratelimit-Remaining are spread across the rate limit
+    window, and a 429 pauses all callers until its Retry-After has passed.
+    """
+
+    def __init__(self, rate, capacity):
+        self.base_rate = rate
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.remaining = None
+        self._updated = time.monotonic()
+        self._paused_until = 0
+        self._condition = threading.Condition()
+
+    def _refill(self, now):
+        if math.isinf(self.rate):
+            self.tokens = self.capacity
+        else:
+            self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    # Function to block until the caller is allowed to make one API call
+    def acquire(self):
+        with self._condition:
+            while True:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    wait = self._paused_until - now
+                else:
+                    self._refill(now)
+                    if self.tokens >= 1:
+                        self.tokens -= 1
+                        return
+                    wait = (1 - self.tokens) / self.rate
+                self._condition.wait(wait)
+
+    # Function to stop handing out tokens for the given number of seconds
+    def pause(self, seconds):
+        with self._condition:
+            now = time.monotonic()
+            self._paused_until = max(self._paused_until, now + seconds)
+            self.tokens = 0
+            self._updated = now
+
+    # Function to adjust the rate from the rate limit headers of a response
+    def update_from_headers(self, headers):
+        remaining = headers.get('X-Ratelimit-Remaining')
+        if remaining is None:
+            return
+        try:
+            remaining = int(remaining)
+        except ValueError:
+            return
+
+        with self._condition:
+            now = time.monotonic()
+            self._refill(now)
+            was_low = self.remaining is not None and self.remaining <= LOW_REMAINING_CALLS
+            self.remaining = remaining
+            self.rate = min(self.base_rate, max(remaining, 1) / RATE_LIMIT_WINDOW)
+            self._condition.notify_all()
+
+        if remaining <= LOW_REMAINING_CALLS and not was_low:
+            logging.warning(f"Slowing down API requests due to low remaining calls. Current remaining {remaining}")
+        elif remaining > LOW_REMAINING_CALLS and was_low:
+            logging.info(f"Returning API rate to normal. Current remaining {remaining}")
+
+
+class RequestScheduler:
+    """
+    Worker pool for FreshService requests, paced by a shared TokenBucket.
+    """
+
+    def __init__(self, workers=DEFAULT_WORKERS, time_wait=DEFAULT_TIME_WAIT):
+        rate = 1000 / time_wait if time_wait > 0 else math.inf
+        self.workers = workers
+        self.bucket = TokenBucket(rate, capacity=workers)
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='fs-fetch')
+
+    # Function to fetch every page of a paginated endpoint.
+    # fetch_page(page) returns (items, total) where total is None if the endpoint does not report it.
+    # Yields the item lists in page order as soon as each one is available.
+    def fetch_pages(self, fetch_page, per_page=100):
+        items, total = fetch_page(1)
+        yield items
+        if len(items) < per_page:
+            return
+
+        if total is not None:
+            # The total is known, so keep a window of pages in flight up to the last one
+            last_page = math.ceil(total / per_page)
+            window = self.workers * PAGES_IN_FLIGHT_PER_WORKER
+        else:
+            # Otherwise request one page per worker ahead, until a short page comes back
+            last_page = None
+            window = self.workers
+
+        # Each future is dropped as soon as its page is yielded, so only the window is held in memory
+        in_flight = deque()
+        next_page = 2
+        try:
+            while True:
+                while len(in_flight) < window and (last_page is None or next_page <= last_page):
+                    in_flight.append(self.executor.submit(fetch_page, next_page))
+                    next_page += 1
+                if not in_flight:
+                    return
+                items, _ = in_flight.popleft().result()
+                if last_page is None and not items:
+                    return
+                yield items
+                if last_page is None and len(items) < per_page:
+                    return
+        finally:
+            # The caller stopped early or the crawl ended, so do not spend API calls on pages nobody reads
+            for pending in in_flight:
+                pending.cancel()
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False)
+
+
+# Function to (re)build the shared scheduler
+def configure_scheduler(workers=DEFAULT_WORKERS, time_wait=DEFAULT_TIME_WAIT):
+    global _scheduler
+    scheduler = RequestScheduler(workers, time_wait)
+    with _scheduler_lock:
+        if _scheduler is not None:
+            _scheduler.shutdown()
+        _scheduler = scheduler
+    logging.info(f"Request scheduler configured. Workers: {workers} Time wait: {time_wait}ms")
+    return scheduler
+
+def get_scheduler():
+    with _scheduler_lock:
+        scheduler = _scheduler
+    if scheduler is None:
+        scheduler = configure_scheduler()
+    return scheduler
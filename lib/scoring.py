@@ -0,0 +1,115 @@
+################################################################################
+# scoring.py scores and orders tickets in batches.
+#
+# - SCORING_MAP compiled into an integer-coded lookup table
+# - NumPy array operations when NumPy is installed, pure Python otherwise
+#
+# Author: Taylor Giddens - taylor.giddens@ingrammicro.com
+# Version: 1.0.3
+################################################################################
+import calendar
+import logging
+from functools import lru_cache
+
+try:
+    import numpy as np
+except ImportError:  # NumPy is optional, the pure Python path gives the same results
+    np = None
+
+# Defaults used when a ticket does not have the field
+DEFAULT_TIER = 'C'
+DEFAULT_PRIORITY = 'Urgent'
+DEFAULT_ENVIRONMENT = 'Production'
+DEFAULT_TICKET_TYPE = 'Incident or Problem'
+
+
+# Function to convert a FreshService timestamp (2024-01-31T10:00:00Z) to epoch seconds.
+# Cached because the same created_at values come back on every refresh.
+@lru_cache(maxsize=200000)
+def parse_timestamp(value):
+    try:
+        return calendar.timegm((int(value[0:4]), int(value[5:7]), int(value[8:10]),
+                                int(value[11:13]), int(value[14:16]), int(value[17:19]), 0, 0, 0))
+    except (TypeError, ValueError):
+        return 0
+
+
+class ScoringEngine:
+    """
+    SCORING_MAP compiled into a flat table indexed by
+    (escalated, tier, priority, environment, ticket_type) codes.
+
+    Each dimension gets one extra "unknown" code for values that are not in
+    the map, and those cells score 0, just like a SCORING_MAP miss.
+    Escalated tickets ignore priority and ticket type, so their score is
+    repeated across both of those dimensions.
+    """
+
+    def __init__(self, scoring_map):
+        full_keys = [key for key in scoring_map if len(key) == 4]
+        escalated_keys = [key for key in scoring_map if len(key) == 3]
+
+        self.tiers = self._codes({key[0] for key in scoring_map})
+        self.priorities = self._codes({key[1] for key in full_keys})
+        self.environments = self._codes({key[2] for key in scoring_map})
+        self.ticket_types = self._codes({key[3] for key in full_keys})
+
+        # Dimension sizes, each with room for the unknown code
+        self.shape = (2, len(self.tiers) + 1, len(self.priorities) + 1,
+                      len(self.environments) + 1, len(self.ticket_types) + 1)
+        table = [0] * (self.shape[0] * self.shape[1] * self.shape[2] * self.shape[3] * self.shape[4])
+
+        for tier, priority, environment, ticket_type in full_keys:
+            index = self._index(0, self.tiers[tier], self.priorities[priority],
+                                self.environments[environment], self.ticket_types[ticket_type])
+            table[index] = scoring_map[(tier, priority, environment, ticket_type)]
+
+        for tier, _, environment in escalated_keys:
+            for priority_code in range(self.shape[2]):
+                for type_code in range(self.shape[4]):
+                    index = self._index(1, self.tiers[tier], priority_code, self.environments[environment], type_code)
+                    table[index] = scoring_map[(tier, 'escalated', environment)]
+
+        self.table = np.array(table, dtype=np.int32) if np is not None else table
+
+    @staticmethod
+    def _codes(values):
+        return {value: code for code, value in enumerate(sorted(values))}
+
+    def _index(self, escalated, tier, priority, environment, ticket_type):
+        _, tiers, priorities, environments, ticket_types = self.shape
+        return (((escalated * tiers + tier) * priorities + priority) * environments + environment) * ticket_types + ticket_type
+
+    # Function to convert each ticket to its position in the lookup table
+    def encode(self, tickets):
+        _, tiers, priorities, environments, ticket_types = self.shape
+        # Codes pre-multiplied by their stride, so a position is just the sum of five lookups
+        escalated_offset = tiers * priorities * environments * ticket_types
+        tier_offsets = {value: code * priorities * environments * ticket_types for value, code in self.tiers.items()}
+        priority_offsets = {value: code * environments * ticket_types for value, code in self.priorities.items()}
+        environment_offsets = {value: code * ticket_types for value, code in self.environments.items()}
+        type_offsets = self.ticket_types
+        unknown_tier = len(self.tiers) * priorities * environments * ticket_types
+        unknown_priority = len(self.priorities) * environments * ticket_types
+        unknown_environment = len(self.environments) * ticket_types
+        unknown_type = len(self.ticket_types)
+
+        indexes = []
+        append = indexes.append
+        for ticket in tickets:
+            account_tier = ticket.get('account_tier', DEFAULT_TIER)
+            if account_tier == 'MISSING':
+                logging.warning("Ticket ID: %s has 'MISSING' account tier. Handling as per logic.", ticket['id'])
+            append((escalated_offset if ticket.get('escalated', False) else 0)
+                   + tier_offsets.get(account_tier, unknown_tier)
+                   + priority_offsets.get(ticket.get('priority', DEFAULT_PRIORITY), unknown_priority)
+                   + environment_offsets.get(ticket.get('environment', DEFAULT_ENVIRONMENT), unknown_environment)
+                   + type_offsets.get(ticket.get('ticket_type', DEFAULT_TICKET_TYPE), unknown_type))
+        return indexes
+
+    # Function to score a batch of tickets. Returns one score per ticket, in the same order.
+    def score(self, tickets):
+        indexes = self.encode(tickets)
+        if np is not None:
+            return self.table[np.array(indexes, dtype=np.intp)].tolist()
+        return [self.table[index] for index in indexes]
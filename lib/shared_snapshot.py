@@ -0,0 +1,230 @@
+################################################################################
+# shared_snapshot.py shares one ticket snapshot between several worker processes.
+#
+# - One fetcher process, elected with a file lock, crawls FreshService
+# - The fetcher writes the serialized snapshot to a memory-mapped file with
+#   a version header
+# - Every other worker maps that file and serves /tickets from the mapping,
+#   decoding the tickets only for the endpoints that need them
+#
+# Author: Taylor Giddens - taylor.giddens@ingrammicro.com
+# Version: 1.0.3
+################################################################################
+import logging
+import mmap
+import os
+import struct
+import threading
+from collections.abc import Sequence
+from pathlib import Path
+from lib.bodies import decode_tickets
+from lib.records import TicketRecord
+from lib.snapshot import TicketSnapshot
+
+try:
+    import fcntl
+except ImportError:  # No flock on Windows, every process fetches for itself there
+    fcntl = None
+
+# magic, format version, snapshot version, updated_at, etag, ticket count, body length
+HEADER_FORMAT = '<4sH2xqd40sQQ'
+HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+MAGIC = b'FSCS'
+FORMAT_VERSION = 2
+DEFAULT_POLL_INTERVAL = 1
+
+
+class SharedSnapshotFile:
+    """
+    Snapshot file laid out as a fixed header followed by the JSON ticket list.
+
+    The writer builds a new file next to the old one and renames it into
+    place, so readers never see a half-written snapshot. Readers keep the
+    file mapped and only map it again when the rename has replaced it. An
+    old mapping stays open while views of its body are still in use, and is
+    unmapped when the last one is released.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self._mapping = None
+        self._identity = None
+
+    # Function to write a new snapshot. body is the JSON encoded list of count tickets.
+    def write(self, version, etag, body, updated_at, count):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        header = struct.pack(HEADER_FORMAT, MAGIC, FORMAT_VERSION, version, updated_at, etag.encode('ascii'), count, len(body))
+        temporary_path = self.path.with_name(f"{self.path.name}.{os.getpid()}.tmp")
+        with open(temporary_path, 'wb') as snapshot_file:
+            snapshot_file.write(header)
+            snapshot_file.write(body)
+        os.replace(temporary_path, self.path)
+
+    # Function to map the current file, mapping it again only if it was replaced
+    def _map(self):
+        try:
+            stat = self.path.stat()
+        except FileNotFoundError:
+            return None
+        identity = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        if identity != self._identity:
+            if stat.st_size < HEADER_SIZE:
+                return None
+            with open(self.path, 'rb') as snapshot_file:
+                mapping = mmap.mmap(snapshot_file.fileno(), 0, access=mmap.ACCESS_READ)
+            # Not closed here, published versions may still hold views of the old body
+            self._mapping = mapping
+            self._identity = identity
+        return self._mapping
+
+    # Function to read the header. Returns (version, etag, updated_at, ticket count, body length)
+    # or None if there is no snapshot yet.
+    def read_header(self):
+        with self._lock:
+            mapping = self._map()
+            if mapping is None:
+                return None
+            magic, format_version, version, updated_at, etag, count, length = struct.unpack_from(HEADER_FORMAT, mapping)
+        if magic != MAGIC or format_version != FORMAT_VERSION:
+            logging.warning(f"Ignoring shared snapshot {self.path} with an unknown format.")
+            return None
+        return version, etag.decode('ascii'), updated_at, count, length
+
+    # Function to return a read-only view of the serialized ticket list in the mapping, without copying it,
+    # if the file still holds the given version
+    def read_body(self, version):
+        with self._lock:
+            mapping = self._map()
+            if mapping is None:
+                return None
+            _, _, current_version, _, _, _, length = struct.unpack_from(HEADER_FORMAT, mapping)
+            if current_version != version:
+                return None
+            return memoryview(mapping)[HEADER_SIZE:HEADER_SIZE + length]
+
+    # Function to load the current file. Returns (version, etag, body, tickets) or None.
+    # The tickets are decoded from the body the first time they are read.
+    def load(self):
+        header = self.read_header()
+        if header is None:
+            return None
+        version, etag, _, count, _ = header
+        body = self.read_body(version)
+        if body is None:
+            return None
+        return version, etag, body, MappedTickets(body, count)
+
+
+class MappedTickets(Sequence):
+    """
+    Ticket list of a shared snapshot, backed by the serialized body in the
+    mapping. len() comes from the file header; the TicketRecords are decoded
+    once, on the first read of a ticket, so a worker that only serves the
+    full /tickets body never decodes the list at all.
+    """
+
+    def __init__(self, body, count):
+        self.body = body
+        self.count = count
+        self._tickets = None
+        self._lock = threading.Lock()
+
+    def _decoded(self):
+        tickets = self._tickets
+        if tickets is None:
+            with self._lock:
+                if self._tickets is None:
+                    self._tickets = [TicketRecord.from_dict(ticket) for ticket in decode_tickets(self.body)]
+                tickets = self._tickets
+        return tickets
+
+    def __getitem__(self, index):
+        return self._decoded()[index]
+
+    def __iter__(self):
+        return iter(self._decoded())
+
+    def __len__(self):
+        return self.count
+
+
+class FetcherElection:
+    """
+    Non-blocking exclusive flock on a lock file. The process that holds it is
+    the fetcher, and the lock is released by the operating system if that
+    process dies, so another worker takes over on its next try.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.held = fcntl is None
+        self._lock_file = None
+
+    def try_acquire(self):
+        if self.held:
+            return True
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        lock_file = open(self.path, 'a')
+        try:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return False
+        self._lock_file = lock_file
+        self.held = True
+        logging.info(f"This process (PID {os.getpid()}) is now the ticket fetcher.")
+        return True
+
+
+class SharedTicketSnapshot(TicketSnapshot):
+    """
+    TicketSnapshot shared by several worker processes through a snapshot file.
+
+    The worker that wins the election crawls every refresh_interval seconds
+    like a normal TicketSnapshot and writes each new version to the file.
+    The others check the file every poll_interval seconds and publish what
+    they find under the fetcher's version and ETag, so version numbers,
+    change diffs and stream events are the same whichever worker answers.
+    """
+
+    def __init__(self, fetch_function, refresh_interval, path, poll_interval=DEFAULT_POLL_INTERVAL):
+        super().__init__(fetch_function, refresh_interval)
+        self.shared_file = SharedSnapshotFile(path)
+        self.election = FetcherElection(f"{path}.lock")
+        self.poll_interval = poll_interval
+
+    # Function to refresh: crawl if this process is the fetcher, otherwise read the fetcher's file
+    def refresh(self):
+        if self.election.try_acquire():
+            return super().refresh()
+        self.sync_from_file()
+        return self.version, self.tickets
+
+    # Function to publish the fetcher's latest version, if it is newer than the one held here
+    def sync_from_file(self):
+        header = self.shared_file.read_header()
+        if header is None or (header[0], header[1]) == (self.version, self.etag):
+            return False
+        loaded = self.shared_file.load()
+        if loaded is None:
+            return False
+        version, etag, body, tickets = loaded
+        return super().publish(tickets, etag, version, body)
+
+    # Function to publish a new ticket list and, in the fetcher, write it for the other workers
+    def publish(self, tickets, etag=None, version=None, body=None):
+        changed = super().publish(tickets, etag, version, body)
+        if changed and self.election.held:
+            with self._condition:
+                version, etag, body, updated_at, count = self.version, self.etag, self.body.identity, self.updated_at, len(self.tickets)
+            try:
+                self.shared_file.write(version, etag, body, updated_at, count)
+            except OSError as e:
+                logging.warning(f"Could not write the shared ticket snapshot: {e}")
+        return changed
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            self.refresh()
+            self._stop_event.wait(self.refresh_interval if self.election.held else self.poll_interval)
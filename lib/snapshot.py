@@ -0,0 +1,284 @@
+################################################################################
+# snapshot.py holds the shared, server-side copy of the sorted ticket list.
+#
+# - Background refresher thread
+# - Single-flight refreshes shared by concurrent requests
+# - Content ETags and a short history of versions for change diffs
+# - Change events fanned out to every subscriber (Server-Sent Events)
+# - Tickets of an in-flight crawl streamed to clients as they arrive
+# - Serialized (and compressed) response body kept with each version
+#
+# Author: Taylor Giddens - taylor.giddens@ingrammicro.com
+# Version: 1.0.3
+################################################################################
+import hashlib
+import logging
+import queue
+import threading
+import time
+from collections import OrderedDict
+from lib.bodies import EncodedBody, encode_tickets
+from lib.metrics import STAGE_SECONDS
+
+HISTORY_SIZE = 10
+SUBSCRIBER_QUEUE_SIZE = 20
+CRAWL_DONE = object()
+
+
+class Subscription(queue.Queue):
+    """
+    Change events for one client. closed is set when the client is dropped
+    for not keeping up, so its stream can end and the browser reconnect.
+    """
+
+    def __init__(self):
+        super().__init__(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        self.closed = False
+
+
+class TicketSnapshot:
+    """
+    Versioned snapshot of the sorted ticket list.
+
+    A single background thread calls fetch_function(progress) every
+    refresh_interval seconds and publishes the result. fetch_function may call
+    progress(ticket) for each ticket as the crawl produces it. Requests read the current snapshot
+    without triggering a crawl; if no snapshot exists yet they wait for the
+    crawl that is already in flight instead of starting their own.
+
+    The version only moves forward when the content changes, and the ETag is
+    a digest of the content, so clients can skip unchanged refreshes. Version
+    numbers start from the process start time so they never repeat across
+    restarts.
+    """
+
+    def __init__(self, fetch_function, refresh_interval):
+        self.fetch_function = fetch_function
+        self.refresh_interval = refresh_interval
+        self.version = int(time.time())
+        self.etag = None
+        self.tickets = None
+        self.body = None
+        self.updated_at = None
+        self._history = OrderedDict()
+        self._subscribers = set()
+        self._crawl_listeners = set()
+        self._crawl_buffer = None
+        self._condition = threading.Condition()
+        self._refreshing = False
+        self._pending_rebuild = None
+        self._derived = {}
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    # Function to run one refresh, or wait for the one already in flight
+    def refresh(self):
+        with self._condition:
+            if self._refreshing:
+                logging.info("Ticket refresh already in progress. Waiting for it to finish.")
+                while self._refreshing:
+                    self._condition.wait()
+                return self.version, self.tickets
+            self._refreshing = True
+            self._crawl_buffer = []
+
+        try:
+            started = time.time()
+            tickets = self.fetch_function(self._report_progress)
+            if self.publish(tickets):
+                logging.info(f"Ticket snapshot version {self.version} published in {time.time() - started:.2f}s.")
+            else:
+                logging.info(f"Tickets unchanged. Keeping snapshot version {self.version}. Refresh took {time.time() - started:.2f}s.")
+        except Exception:
+            logging.exception("Ticket refresh failed. Keeping the previous snapshot.")
+        finally:
+            with self._condition:
+                self._refreshing = False
+                rebuild, self._pending_rebuild = self._pending_rebuild, None
+                self._crawl_buffer = None
+                listeners = self._crawl_listeners
+                self._crawl_listeners = set()
+                self._condition.notify_all()
+            for listener in listeners:
+                listener.put(CRAWL_DONE)
+            if rebuild is not None:
+                self.republish(rebuild)
+
+        return self.version, self.tickets
+
+    # Function called by fetch_function for each ticket the crawl produces
+    def _report_progress(self, ticket):
+        with self._condition:
+            if self._crawl_buffer is not None:
+                self._crawl_buffer.append(ticket)
+            listeners = list(self._crawl_listeners)
+        for listener in listeners:
+            listener.put(ticket)
+
+    # Function to follow a crawl. Yields the tickets the crawl has produced so far, then each
+    # new one as it arrives, and returns when the crawl ends. Starts a crawl if none is running.
+    def follow_crawl(self):
+        listener = queue.Queue()
+        with self._condition:
+            buffered = list(self._crawl_buffer or [])
+            self._crawl_listeners.add(listener)
+            if not self._refreshing:
+                threading.Thread(target=self.refresh, name='ticket-refresh', daemon=True).start()
+
+        try:
+            yield from buffered
+            while True:
+                ticket = listener.get()
+                if ticket is CRAWL_DONE:
+                    return
+                yield ticket
+        finally:
+            with self._condition:
+                self._crawl_listeners.discard(listener)
+
+    # Function to replace the current ticket list with a new one. etag, version and the serialized
+    # body can be passed in when they were already worked out elsewhere (e.g. by the fetcher process).
+    # Returns True if the content changed and a new version was published.
+    def publish(self, tickets, etag=None, version=None, body=None):
+        # Serialize once per publish, the same bytes give the ETag and every /tickets response
+        if body is None:
+            with STAGE_SECONDS.labels('serialize').time():
+                body = encode_tickets(tickets)
+        if etag is None:
+            with STAGE_SECONDS.labels('etag').time():
+                etag = hashlib.sha1(body).hexdigest()
+        with self._condition:
+            self.updated_at = time.time()
+            if etag == self.etag:
+                return False
+            previous = self.tickets
+            self.tickets = tickets
+            self.body = EncodedBody(body)
+            self.etag = etag
+            self.version = version if version is not None else self.version + 1
+            version = self.version
+            self._history[version] = tickets
+            while len(self._history) > HISTORY_SIZE:
+                self._history.popitem(last=False)
+            subscribers = list(self._subscribers)
+
+        # One diff per publish, shared by every connected client
+        if subscribers and previous is not None:
+            self._notify(subscribers, {'version': version, **diff_tickets(previous, tickets)})
+        return True
+
+    # Function to publish a list rebuilt from local state, without a crawl (e.g. when a deadline passes).
+    # A refresh in flight may have built its list before the change, so the rebuild then runs after it.
+    def republish(self, build):
+        with self._condition:
+            if self._refreshing:
+                self._pending_rebuild = build
+                return False
+        return self.publish(build())
+
+    # Function to register a client for change events. Returns the queue the events arrive on.
+    def subscribe(self):
+        subscription = Subscription()
+        with self._condition:
+            self._subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._condition:
+            self._subscribers.discard(subscription)
+
+    def _notify(self, subscribers, event):
+        for subscription in subscribers:
+            try:
+                subscription.put_nowait(event)
+            except queue.Full:
+                # The client stopped reading. Drop it and close its stream, so the browser reconnects and resyncs.
+                logging.warning("Dropping a ticket stream subscriber that is not keeping up.")
+                subscription.closed = True
+                self.unsubscribe(subscription)
+
+    # Function to return the changes between an earlier version and the current one.
+    # Returns None if the earlier version is no longer in the history.
+    def changes_since(self, since_version):
+        with self._condition:
+            version, tickets = self.version, self.tickets
+            previous = self._history.get(since_version)
+        if previous is None:
+            return None
+        return version, diff_tickets(previous, tickets)
+
+    # Function to return the current snapshot, crawling only if there is none yet
+    def get(self):
+        with self._condition:
+            if self.tickets is not None:
+                return self.version, self.tickets
+        return self.refresh()
+
+    # Function to return the version, ETag and tickets of the current snapshot together
+    def state(self):
+        with self._condition:
+            return self.version, self.etag, self.tickets
+
+    # Function to return the serialized ticket list of a version, or None if that version is no longer current
+    def encoded_body(self, version):
+        with self._condition:
+            return self.body if version == self.version else None
+
+    # Function to return data built from the current snapshot, building it once per version
+    def derived(self, name, build):
+        with self._condition:
+            version, tickets = self.version, self.tickets
+            cached = self._derived.get(name)
+            if cached is not None and cached[0] == version:
+                return cached[1]
+
+        value = build(tickets)
+        with self._condition:
+            if self.version == version:
+                self._derived[name] = (version, value)
+        return value
+
+    # Function to start the background refresher thread
+    def start(self):
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name='ticket-refresher', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            self.refresh()
+            self._stop_event.wait(self.refresh_interval)
+
+
+# Function to compare two sorted ticket lists.
+# Returns the added and changed tickets, the removed IDs, the IDs that became past due
+# and the new rank of every ticket that moved.
+def diff_tickets(previous, current):
+    previous_by_id = {ticket['id']: (rank, ticket) for rank, ticket in enumerate(previous)}
+    current_ids = set()
+    added = []
+    changed = []
+    past_due = []
+    ranks = {}
+
+    for rank, ticket in enumerate(current):
+        current_ids.add(ticket['id'])
+        previous_entry = previous_by_id.get(ticket['id'])
+        if previous_entry is None:
+            added.append(ticket)
+            ranks[ticket['id']] = rank
+            continue
+        previous_rank, previous_ticket = previous_entry
+        if previous_ticket != ticket:
+            changed.append(ticket)
+            if ticket.get('is_past_due') and not previous_ticket.get('is_past_due'):
+                past_due.append(ticket['id'])
+        if previous_rank != rank:
+            ranks[ticket['id']] = rank
+
+    removed = [ticket_id for ticket_id in previous_by_id if ticket_id not in current_ids]
+    return {'added': added, 'changed': changed, 'removed': removed, 'past_due': past_due, 'ranks': ranks}
@@ -0,0 +1,153 @@
+################################################################################
+# store.py persists tickets and reference data in a local SQLite database.
+#
+# - Warm starts: the last ticket list is served while the first refresh runs
+# - Reference directories for the reference cache
+# - Incremental sync state (watermark and last full sync)
+#
+# Author: Taylor Giddens - taylor.giddens@ingrammicro.com
+# Version: 1.0.3
+################################################################################
+import json
+import logging
+import sqlite3
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from lib.records import TicketRecord, json_default
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS tickets (
+    id INTEGER PRIMARY KEY,
+    position INTEGER NOT NULL,
+    group_name TEXT,
+    agent_email TEXT,
+    score INTEGER,
+    due_by TEXT,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_tickets_position ON tickets (position);
+CREATE INDEX IF NOT EXISTS idx_tickets_group_name ON tickets (group_name);
+CREATE INDEX IF NOT EXISTS idx_tickets_agent_email ON tickets (agent_email);
+CREATE INDEX IF NOT EXISTS idx_tickets_score ON tickets (score);
+CREATE INDEX IF NOT EXISTS idx_tickets_due_by ON tickets (due_by);
+
+CREATE TABLE IF NOT EXISTS reference_records (
+    entity TEXT NOT NULL,
+    id INTEGER NOT NULL,
+    data TEXT NOT NULL,
+    PRIMARY KEY (entity, id)
+);
+
+CREATE TABLE IF NOT EXISTS reference_directories (
+    entity TEXT PRIMARY KEY,
+    fetched_at REAL NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS sync_state (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+
+class TicketStore:
+    """
+    SQLite database holding the last published ticket list, the reference
+    directories and the incremental sync state. Every save is written in a
+    single transaction.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        with self._connect() as connection:
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.executescript(SCHEMA)
+
+    # Function to open a connection that commits on success and is always closed
+    @contextmanager
+    def _connect(self):
+        connection = sqlite3.connect(str(self.path), timeout=30)
+        try:
+            with connection:
+                yield connection
+        finally:
+            connection.close()
+
+    # Function to replace the stored ticket list and sync state in one transaction
+    def save_tickets(self, tickets, watermark=None, last_full_sync=None):
+        rows = [ticket_row(ticket, position) for position, ticket in enumerate(tickets)]
+        with self._lock, self._connect() as connection:
+            connection.execute("DELETE FROM tickets")
+            connection.executemany(INSERT_TICKET, rows)
+            save_sync_state(connection, watermark, last_full_sync)
+        logging.info(f"Saved {len(rows)} tickets to {self.path}")
+
+    # Function to apply an incremental sync in one transaction: upsert the updated tickets and delete the removed IDs.
+    # positions maps ticket ID to its current queue position. Positions of untouched rows are left as they were,
+    # so the stored order is only approximate until the next full save; restoring re-sorts the tickets anyway.
+    def update_tickets(self, tickets, removed_ids, watermark=None, last_full_sync=None, positions=None):
+        positions = positions or {}
+        rows = [ticket_row(ticket, positions.get(ticket['id'], 0)) for ticket in tickets]
+        with self._lock, self._connect() as connection:
+            connection.executemany(INSERT_TICKET, rows)
+            connection.executemany("DELETE FROM tickets WHERE id = ?", [(ticket_id,) for ticket_id in removed_ids])
+            save_sync_state(connection, watermark, last_full_sync)
+        logging.info(f"Updated {len(rows)} and removed {len(removed_ids)} tickets in {self.path}")
+
+    # Function to load the stored ticket list in its saved order
+    def load_tickets(self):
+        with self._connect() as connection:
+            rows = connection.execute("SELECT data FROM tickets ORDER BY position").fetchall()
+        # The stored sort key is ignored, records derive it from score and created_at
+        return [TicketRecord.from_dict(json.loads(row[0])) for row in rows]
+
+    # Function to load the incremental sync state. Returns (watermark, last_full_sync).
+    def load_sync_state(self):
+        with self._connect() as connection:
+            state = dict(connection.execute("SELECT key, value FROM sync_state").fetchall())
+        last_full_sync = state.get('last_full_sync')
+        return state.get('watermark'), json.loads(last_full_sync) if last_full_sync else None
+
+    # Function to replace one stored reference directory in one transaction
+    def save_directory(self, entity, fetched_at, records):
+        with self._lock, self._connect() as connection:
+            connection.execute("DELETE FROM reference_records WHERE entity = ?", (entity,))
+            connection.execute("INSERT OR REPLACE INTO reference_directories (entity, fetched_at) VALUES (?, ?)",
+                               (entity, fetched_at))
+            connection.executemany(
+                "INSERT INTO reference_records (entity, id, data) VALUES (?, ?, ?)",
+                [(entity, record_id, json.dumps(value)) for record_id, value in records.items()])
+
+    # Function to store a single reference record fetched outside a full directory crawl
+    def save_reference(self, entity, record_id, value):
+        with self._lock, self._connect() as connection:
+            connection.execute("INSERT OR REPLACE INTO reference_records (entity, id, data) VALUES (?, ?, ?)",
+                               (entity, record_id, json.dumps(value)))
+
+    # Function to load the stored reference directories in the reference cache format
+    def load_references(self):
+        entries = {}
+        with self._connect() as connection:
+            for entity, fetched_at in connection.execute("SELECT entity, fetched_at FROM reference_directories"):
+                entries[entity] = {'fetched_at': fetched_at, 'records': {}}
+            for entity, record_id, data in connection.execute("SELECT entity, id, data FROM reference_records"):
+                entry = entries.setdefault(entity, {'fetched_at': 0, 'records': {}})
+                entry['records'][record_id] = json.loads(data)
+        return entries
+
+
+INSERT_TICKET = ("INSERT OR REPLACE INTO tickets (id, position, group_name, agent_email, score, due_by, data) "
+                 "VALUES (?, ?, ?, ?, ?, ?, ?)")
+
+# Function to build the tickets table row for a ticket
+def ticket_row(ticket, position):
+    return (ticket['id'], position, ticket.get('group_name'), ticket.get('agent_email'),
+            ticket.get('score'), ticket.get('due_by'), json.dumps(ticket, default=json_default))
+
+def save_sync_state(connection, watermark, last_full_sync):
+    connection.executemany(
+        "INSERT OR REPLACE INTO sync_state (key, value) VALUES (?, ?)",
+        [('watermark', watermark), ('last_full_sync', json.dumps(last_full_sync))])
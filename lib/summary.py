@@ -0,0 +1,102 @@
+################################################################################
+# summary.py keeps the dashboard counters for the open ticket queue.
+#
+# - Ticket counts per filter value (company, group, agent, tier, ...)
+# - Updated ticket by ticket as tickets are added, changed or removed
+# - Totals for the dashboard read straight from those counts
+#
+# Author: Taylor Giddens - taylor.giddens@ingrammicro.com
+# Version: 1.0.3
+################################################################################
+from collections import Counter
+
+UNASSIGNED = '* Unassigned *'
+
+# Statuses the dashboard counts as done
+DONE_STATUSES = ('Pending', 'Resolved', 'Closed', 'Rejected', 'Duplicate')
+
+INCIDENT_TYPE = 'Incident or Problem'
+SERVICE_REQUEST_TYPE = 'Service request'
+
+
+def text(value):
+    return '' if value is None else value
+
+def yes_no(value):
+    return 'Yes' if value else 'No'
+
+def assigned(value):
+    return value or UNASSIGNED
+
+# Dashboard filter categories and the value each ticket is counted under
+CATEGORIES = {
+    'company': lambda ticket: text(ticket['company_name']),
+    'group': lambda ticket: assigned(ticket['group_name']),
+    'agent': lambda ticket: assigned(ticket['agent_name']),
+    'tier': lambda ticket: text(ticket['account_tier']),
+    'priority': lambda ticket: text(ticket['priority']),
+    'status': lambda ticket: text(ticket['status']),
+    'type': lambda ticket: text(ticket['ticket_type']),
+    'environment': lambda ticket: text(ticket['environment']),
+    'escalated': lambda ticket: yes_no(ticket['escalated']),
+    'overdue': lambda ticket: yes_no(ticket['is_past_due']),
+}
+
+
+class QueueSummary:
+    """
+    Ticket counts per value of every dashboard filter category.
+
+    add(), remove() and update() touch one counter per category, so keeping
+    the summary current costs the same whatever the queue length, and
+    to_dict() only walks the distinct values, never the tickets.
+    """
+
+    def __init__(self, tickets=()):
+        self.total = 0
+        self.counts = {category: Counter() for category in CATEGORIES}
+        self.rebuild(tickets)
+
+    # Function to recount from scratch, used after a full crawl
+    def rebuild(self, tickets):
+        self.total = 0
+        self.counts = {category: Counter() for category in CATEGORIES}
+        for ticket in tickets:
+            self.add(ticket)
+
+    def add(self, ticket):
+        self.total += 1
+        for category, value_of in CATEGORIES.items():
+            self.counts[category][value_of(ticket)] += 1
+
+    def remove(self, ticket):
+        self.total -= 1
+        for category, value_of in CATEGORIES.items():
+            counts = self.counts[category]
+            value = value_of(ticket)
+            counts[value] -= 1
+            if counts[value] <= 0:
+                del counts[value]
+
+    # Function to move a ticket from its previous values to its new ones. previous may be None for a new ticket.
+    def update(self, previous, ticket):
+        if previous is not None:
+            self.remove(previous)
+        self.add(ticket)
+
+    # Function to return the summary in the JSON shape served by /tickets/summary
+    def to_dict(self):
+        counts = self.counts
+        return {
+            'total': self.total,
+            'incidents': counts['type'].get(INCIDENT_TYPE, 0),
+            'service_requests': counts['type'].get(SERVICE_REQUEST_TYPE, 0),
+            'escalated': counts['escalated'].get('Yes', 0),
+            'overdue': counts['overdue'].get('Yes', 0),
+            'done': sum(counts['status'].get(status, 0) for status in DONE_STATUSES),
+            'by_group': dict(counts['group']),
+            'by_agent': dict(counts['agent']),
+            'by_tier': dict(counts['tier']),
+            'filters': {category: dict(values) for category, values in counts.items()},
+        }
+
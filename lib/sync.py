@@ -0,0 +1,159 @@
+################################################################################
+# sync.py keeps the open ticket set in memory between refreshes.
+#
+# - Incremental sync using the newest updated_at seen as a watermark
+# - Periodic full reconcile to catch anything the delta missed
+# - Queue order kept in a priority index, so a delta does not re-sort everything
+# - Past-due flags flipped by the deadline scheduler between refreshes
+# - Dashboard counters kept alongside, updated only for the tickets that change
+#
+# Author: Taylor Giddens - taylor.giddens@ingrammicro.com
+# Version: 1.0.3
+################################################################################
+import logging
+import threading
+import time
+from lib.priority_index import PriorityIndex
+from lib.summary import QueueSummary
+from lib.deadlines import DEADLINE_FIELDS
+
+# Seconds the watermark is held back from the start of a crawl, for clock differences with FreshService
+CLOCK_SKEW_MARGIN = 120
+
+
+class OrderedTickets(list):
+    """
+    Ticket list in queue order, carrying the dashboard counters of the same
+    tickets. Both are taken under one lock, so a published list and its
+    summary always describe the same version.
+    """
+
+    def __init__(self, tickets, summary):
+        super().__init__(tickets)
+        self.summary = summary
+
+
+class TicketSync:
+    """
+    In-memory open ticket set keyed by ticket ID.
+
+    A full crawl replaces the set and resets the watermark. Between full
+    crawls, merge() applies only the tickets updated since the watermark and
+    drops the ones that are no longer open.
+
+    Tickets must already be scored. The queue order is kept in a
+    PriorityIndex that only moves the tickets a merge touches, and the
+    dashboard counters in a QueueSummary updated the same way.
+
+    If a DeadlineScheduler is given, every ticket change is passed on to it
+    so is_past_due and is_fr_past_due flip when the deadline passes rather
+    than on the next crawl.
+    """
+
+    def __init__(self, full_sync_interval, deadlines=None):
+        self.full_sync_interval = full_sync_interval
+        self.deadlines = deadlines
+        self.tickets = {}
+        self.index = PriorityIndex()
+        self.summary = QueueSummary()
+        self.watermark = None
+        self.last_full_sync = None
+        self._lock = threading.Lock()
+
+    # Function to check if the next refresh should be a full crawl
+    def needs_full_sync(self):
+        if self.watermark is None or self.last_full_sync is None:
+            return True
+        return time.time() - self.last_full_sync >= self.full_sync_interval
+
+    # Function to move the watermark to the newest updated_at seen, but no later than the start of the crawl.
+    # Pages are fetched in parallel while tickets keep changing, so a ticket read early in a crawl can be
+    # updated after a later page shows a newer updated_at; the next window has to start before that update.
+    def _advance_watermark(self, tickets, started_at=None):
+        for ticket in tickets:
+            # FreshService timestamps are all UTC in the same format, so they compare as strings
+            if self.watermark is None or ticket['updated_at'] > self.watermark:
+                self.watermark = ticket['updated_at']
+        if started_at is not None and self.watermark is not None:
+            self.watermark = min(self.watermark, format_timestamp(started_at - CLOCK_SKEW_MARGIN))
+
+    # Function to replace the whole set with the result of a full crawl. started_at is the
+    # epoch time the crawl started, it caps the watermark.
+    def replace(self, tickets, started_at=None):
+        with self._lock:
+            self.tickets = {ticket['id']: ticket for ticket in tickets}
+            self.index.rebuild(tickets)
+            # Count the de-duplicated set, a crawl can return a ticket twice when it moves between pages
+            self.summary.rebuild(self.tickets.values())
+            self.watermark = None
+            self._advance_watermark(tickets, started_at)
+            self.last_full_sync = time.time()
+            if self.deadlines is not None:
+                self.deadlines.reset(tickets)
+        logging.info(f"Full ticket sync complete. Tickets: {len(tickets)} Watermark: {self.watermark}")
+
+    # Function to restore the set saved by a previous run
+    def restore(self, tickets, watermark, last_full_sync):
+        with self._lock:
+            self.tickets = {ticket['id']: ticket for ticket in tickets}
+            self.index.rebuild(tickets)
+            self.summary.rebuild(self.tickets.values())
+            self.watermark = watermark
+            self.last_full_sync = last_full_sync
+            if self.deadlines is not None:
+                # Flags saved by an earlier run may be stale, deadlines already passed fire straight away
+                self.deadlines.reset(tickets)
+        logging.info(f"Restored {len(tickets)} tickets from the ticket store. Watermark: {watermark}")
+
+    # Function to apply the tickets updated since the watermark. started_at is the epoch time the fetch started.
+    def merge(self, updated_tickets, closed_tickets, started_at=None):
+        with self._lock:
+            for ticket in updated_tickets:
+                self.summary.update(self.tickets.get(ticket['id']), ticket)
+                self.tickets[ticket['id']] = ticket
+                self.index.upsert(ticket)
+            removed = 0
+            for ticket in closed_tickets:
+                previous = self.tickets.pop(ticket['id'], None)
+                if previous is not None:
+                    self.index.remove(ticket['id'])
+                    self.summary.remove(previous)
+                    removed += 1
+            self._advance_watermark(updated_tickets)
+            self._advance_watermark(closed_tickets, started_at)
+            if self.deadlines is not None:
+                self.deadlines.track(updated_tickets)
+                self.deadlines.untrack(ticket['id'] for ticket in closed_tickets)
+        logging.info(f"Incremental ticket sync complete. Updated: {len(updated_tickets)} Removed: {removed} "
+                     f"Watermark: {self.watermark}")
+
+    # Function to set the flags of passed deadlines. due lists (ticket ID, deadline field) pairs.
+    # Returns the number of tickets that changed.
+    def mark_past_due(self, due):
+        changed = 0
+        with self._lock:
+            for ticket_id, field in due:
+                ticket = self.tickets.get(ticket_id)
+                flag = DEADLINE_FIELDS[field]
+                if ticket is not None and not ticket.get(flag):
+                    # Copy instead of updating in place, earlier snapshots still hold the old dict
+                    self.tickets[ticket_id] = ticket.copy(**{flag: True})
+                    self.summary.update(ticket, self.tickets[ticket_id])
+                    changed += 1
+        return changed
+
+    # Function to return the current ticket list in queue order, with its dashboard counters
+    def ordered(self):
+        with self._lock:
+            return OrderedTickets((self.tickets[ticket_id] for ticket_id in self.index), self.summary.to_dict())
+
+    # Function to return (zero-based position, queue length) for a ticket, or None if it is not open
+    def rank(self, ticket_id):
+        with self._lock:
+            position = self.index.rank(ticket_id)
+            return None if position is None else (position, len(self.index))
+
+
+# Function to format epoch seconds the way FreshService formats its timestamps
+def format_timestamp(epoch):
+    return time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(epoch))
@@ -6,65 +6,85 @@
 # Author: Taylor Giddens - taylor.giddens@ingrammicro.com
 # Version: 1.0.3
 ################################################################################
-import requests
 import logging
-from datetime import datetime
+import time
+from lib.transport import get_json
+from lib.scheduler import get_scheduler
+from lib.scoring import ScoringEngine
+from lib.deadlines import parse_deadline
+from lib.records import TicketRecord
+from lib.metrics import STAGE_SECONDS
+from lib.logs import console_progress
 
-def check_past_due(ticket):
-    # Check if 'due_by' field exists
-    if 'due_by' in ticket:
-        due_date_str = ticket['due_by']
-
-        # Convert due date string to datetime object
-        try:
-            due_date = datetime.strptime(due_date_str, "%Y-%m-%dT%H:%M:%SZ")
+# Function to check if a ticket deadline (due_by or fr_due_by) has passed.
+# FreshService dates are UTC, so they are compared as epoch seconds rather than against the local clock.
+def check_past_due(ticket, field='due_by'):
+    # Check if the deadline field exists. An empty fr_due_by is normal, so only due_by is reported.
+    if not ticket.get(field):
+        if field == 'due_by':
+            logging.warning("Ticket ID %s does not have a 'due_by' field.", ticket['id'])
+        return False
 
-            # Compare due date with current date
-            if due_date < datetime.now(due_date.tzinfo):
-                return True  # Ticket is past due
-            else:
-                return False  # Ticket is not past due
-        except ValueError:
-            # Handle incorrect date format
-            print(f"Incorrect date format for ticket ID {ticket['id']}. Due date: {due_date_str}")
-            return False
-    else:
-        # If 'due_by' field is missing
-        print(f"Ticket ID {ticket['id']} does not have a 'due_by' field.")
+    due_date = parse_deadline(ticket[field])
+    if due_date is None:
+        # Handle incorrect date format
+        logging.warning("Incorrect date format for ticket ID %s. %s: %s", ticket['id'], field, ticket[field])
         return False
+    return due_date <= time.time()
 
-# Function to convert numerical status and priority to readable strings
-def make_status_priority_readable(tickets):
-    # Mappings for status and priority
-    status_mapping = {
-        2: "Open",
-        3: "Pending",
-        4: "Resolved",
-        5: "Closed",
-        6: "New",
-        7: "Pending access",
-        8: "Waiting for RnD",
-        9: "Pending other ticket",
-        10: "Waiting for maintenance",
-        11: "Waiting for bugfix",
-        12: "Service request triage",
-        13: "Rejected",
-        14: "Duplicate"
-    }
+# Function to check if a ticket has had its first response. The stats come with include=stats on the
+# ticket list; without them, a first response deadline that passed without FreshService escalating it
+# (fr_escalated) was met.
+def has_first_response(ticket):
+    stats = ticket.get('stats') or {}
+    if stats.get('first_responded_at'):
+        return True
+    return ticket.get('fr_escalated') is False and check_past_due(ticket, 'fr_due_by')
+
+# Mappings for status and priority
+STATUS_MAPPING = {
+    2: "Open",
+    3: "Pending",
+    4: "Resolved",
+    5: "Closed",
+    6: "New",
+    7: "Pending access",
+    8: "Waiting for RnD",
+    9: "Pending other ticket",
+    10: "Waiting for maintenance",
+    11: "Waiting for bugfix",
+    12: "Service request triage",
+    13: "Rejected",
+    14: "Duplicate"
+}
+
+PRIORITY_MAPPING = {
+    1: "Low",
+    2: "Medium",
+    3: "High",
+    4: "Urgent"
+}
 
-    priority_mapping = {
-        1: "Low",
-        2: "Medium",
-        3: "High",
-        4: "Urgent"
-    }
+# Function to convert the numerical status and priority of one ticket to readable strings
+def make_ticket_readable(ticket):
+    ticket['status'] = STATUS_MAPPING.get(ticket['status'], "Unknown Status")
+    ticket['priority'] = PRIORITY_MAPPING.get(ticket['priority'], "Unknown Priority")
+    return ticket
 
+# Function to convert numerical status and priority to readable strings
+def make_status_priority_readable(tickets):
     # Iterate through each ticket and update status and priority
     for ticket in tickets:
-        ticket['status'] = status_mapping.get(ticket['status'], "Unknown Status")
-        ticket['priority'] = priority_mapping.get(ticket['priority'], "Unknown Priority")
+        make_ticket_readable(ticket)
+
+    return tickets
+
+# Statuses the dashboard treats as open. Tickets in any other status drop out of the queue.
+OPEN_STATUSES = [2, 3, 6, 7, 8, 9, 10, 11, 12]
 
-    return tickets   
+# Function to build the filter query that matches any of the given statuses
+def build_status_query(statuses):
+    return ' OR '.join(f"status: {status}" for status in statuses)
 
 #Scoring map used to sort tickets in a finute order. 
 SCORING_MAP = {
@@ -146,163 +166,141 @@ SCORING_MAP = {
     ('E', 'Low', 'Lab', 'Service request'): 1
 }
 
-# Function that performs the scoring against the SCORING_MAP
-def calculate_sort_key(ticket):
-    # Check if 'custom_fields' exists in the ticket, assign default if not
-    #custom_fields = ticket.get('custom_fields', {})
-
-    # Extract values from ticket or use defaults
-    account_tier = ticket.get('account_tier', 'C')  # Default to 'C' if not present
-    environment = ticket.get('environment', 'Production')  # Default to 'Production' if not present
-    priority = ticket.get('priority', 'Urgent')  # Default to 'Urgent' if not present
-    ticket_type = ticket.get('ticket_type', 'Incident or Problem')  # Default to 'Incident or Problem' if not present
-    escalated = ticket.get('escalated', False)  # Default to False if not present
-
-    # Handle 'MISSING' account_tier
-    if account_tier == 'MISSING':
-        # Define how to handle 'MISSING' account_tier, if different from 'C'
-        # For example, you might want to log this or assign a different default
-        logging.warning(f"Ticket ID: {ticket['id']} has 'MISSING' account tier. Handling as per logic.")
-
-    # Determine score key based on whether the ticket is escalated
-    if escalated:
-        score_key = (account_tier, 'escalated', environment)
-    else:
-        score_key = (account_tier, priority, environment, ticket_type)
-
-    # Get the score from the map
-    score = SCORING_MAP.get(score_key, 0)
+# SCORING_MAP compiled into lookup tables, used to score tickets in batches
+SCORING_ENGINE = ScoringEngine(SCORING_MAP)
 
-    # Log for debugging
-    logging.debug(f"Calculated score key for Ticket ID {ticket['id']}: {score_key}, Score: {score}")
+# Function to score a batch of tickets and store the score on each one
+def score_tickets(tickets):
+    scores = SCORING_ENGINE.score(tickets)
+    for ticket, score in zip(tickets, scores):
+        ticket['score'] = score  # Store the actual score
+    return tickets
 
-    return (-score, ticket['created_at'])
+# Function to resolve a reference ID, fetching just that record if the directory does not have it
+def resolve_reference(directory, entity, record_id, lookup_missing, default):
+    value = directory.get(record_id)
+    if value is None and record_id is not None and lookup_missing is not None:
+        value = lookup_missing(entity, record_id)
+    return default if value is None else value
 
-#Function to perform final sorting based on the final scoring (Sort Key).
-def sort_tickets(tickets):
-    # Calculate the sort key for each ticket and store the score
-    for ticket in tickets:
-        sort_key = calculate_sort_key(ticket)
-        ticket['score'] = -sort_key[0]  # Store the actual score
-        ticket['sort_key'] = sort_key   # Store the sort key
+# Function to turn a raw FreshService ticket into the record used by the dashboard
+def transform_ticket(ticket, agents, companies, groups, lookup_missing=None):
+    # Gathering agent information
+    agent_info = resolve_reference(agents, 'agents', ticket['responder_id'], lookup_missing, {'name': '* Unassigned *', 'email': 'N/A'})
+    
+    # Check if account_tier is None (null in JSON) and set it to 'MISSING' if it is
+    account_tier = ticket['custom_fields'].get('account_tier')
+    if account_tier is None:
+        account_tier = 'C'
+        
+    # Check if environment is None (null in JSON) and set it to 'MISSING' if it is
+    environment = ticket['custom_fields'].get('environment')
+    if environment is None:
+        environment = 'Production'
+        
+    # Check if ticket_type is None (null in JSON) and set it to 'MISSING' if it is 
+    ticket_type = ticket['custom_fields'].get('ticket_type')
+    if ticket_type is None:
+        ticket_type = 'Service request'    
+        
+    # Check if the ticket is past due. Later transitions are applied by the deadline scheduler.
+    is_past_due = check_past_due(ticket)
+    # Only an unanswered ticket can breach its first response deadline
+    fr_responded = has_first_response(ticket)
+    is_fr_past_due = not fr_responded and check_past_due(ticket, 'fr_due_by')
 
-    # Sort the tickets based on the calculated sort key
-    tickets.sort(key=lambda x: x['sort_key'])
+    escalated_value = ticket['custom_fields'].get('escalated')
+    if escalated_value == "Yes":
+        escalated = True
+    elif escalated_value == "No" or escalated_value is None:
+        escalated = False
+        
+    # Filtering and transforming ticket data
+    return TicketRecord(**{
+        'id': ticket['id'],
+        'subject': ticket['subject'],
+        'group_name': resolve_reference(groups, 'groups', ticket['group_id'], lookup_missing, '* Unassigned *'),
+        'company_name': resolve_reference(companies, 'departments', ticket['department_id'], lookup_missing, 'Unknown Company'),
+        'priority': ticket['priority'],
+        'status': ticket['status'],
+        'created_at': ticket['created_at'],
+        'updated_at': ticket['updated_at'],
+        'fr_due_by': ticket['fr_due_by'],
+        'due_by': ticket['due_by'],
+        'is_past_due': is_past_due,
+        'is_fr_past_due': is_fr_past_due,
+        'fr_responded': fr_responded,
+        'agent_name': agent_info['name'],
+        'agent_email': agent_info['email'],
+        'account_tier': account_tier,
+        'environment': environment,
+        'escalated': escalated,
+        'ticket_type': ticket_type
+    })
 
-    # Debug logging if needed
-    if logging.getLogger().getEffectiveLevel() == logging.DEBUG:
-        for ticket in tickets:
-            logging.debug(f"Ticket ID: {ticket['id']}, Score: {ticket['score']}, Created At: {ticket['created_at']}, Tier: {ticket['account_tier']}, Priority: {ticket['priority']}, Is Escalated: {ticket['escalated']}, Environment: {ticket['environment']}, Type: {ticket['ticket_type']}")
+# Function to fetch the open ticket pages. Yields each page's raw tickets as soon as it is available.
+def iter_ticket_pages(base_url, headers, statuses=OPEN_STATUSES):
+    page_count = 0
+    ticket_count = 0
+    logging.info("Starting to retrieve tickets from %s", base_url)
 
-    return tickets
+    def fetch_page(page):
+        url = f"{base_url}/api/v2/tickets/filter?query=\"{build_status_query(statuses)}\"&per_page=100&page={page}"
+        logging.debug("Requesting page %s of tickets.", page)
+        data = get_json(url, headers, 'ticket_page')
+        return data.get('tickets') or [], data.get('total')
 
-def make_api_request(method, url, headers, data=None, retries=2):
-    try:
-        response = requests.request(method, url, headers=headers, json=data)
-        if response.status_code in [401, 403, 429]:
-            logging.error(f"Error {response.status_code} encountered. URL: {url} Method: {method}")
-            response.raise_for_status()
-        else:
-            logging.info(f"API request successful. URL: {url} Method: {method} Status Code: {response.status_code}")
-        return response
-    except requests.exceptions.Timeout:
-        if retries > 0:
-            logging.warning("Timeout encountered. Retrying...")
-            return make_api_request(method, url, headers, data, retries - 1)
-        else:
-            logging.error("Maximum retries reached for timeout.")
-            raise
-    except requests.exceptions.RequestException as e:
-        logging.error(f"API request failed: {e}")
-        raise    
+    for page_tickets in get_scheduler().fetch_pages(fetch_page):
+        page_count += 1
+        if not page_tickets:
+            break
+        ticket_count += len(page_tickets)
+        logging.info("Page %s of tickets retrieved. Count: %s", page_count, len(page_tickets))
+        console_progress.update("Page %s of tickets retrieved. Tickets so far: %s", page_count, ticket_count)
+        yield page_tickets
 
-def get_all_tickets(base_url, headers, agents, companies, groups):
-    tickets = []
-    page = 1
-    logging.info(f"Starting to retrieve tickets from {base_url}")
-    
-    while True:
-        url = f"https://{base_url}.freshservice.com/api/v2/tickets/filter?query=\"status: 2 OR status: 3 OR status: 6 OR status: 7 OR status: 8 OR status: 9 OR status: 10 OR status: 11 OR status: 12\"&per_page=100&page={page}"
-        logging.info(f"Requesting page {page} of tickets.")
-        print(f"{datetime.now().strftime('%Y-%m-%d %H:%M:%S')} - Requesting page {page} of tickets.")
-        response = make_api_request("GET", url, headers)
-        data = response.json()
-        
-        if 'tickets' in data and data['tickets']:
-            for ticket in data['tickets']:
-                # Gathering agent information
-                agent_info = agents.get(ticket['responder_id'], {'name': '* Unassigned *', 'email': 'N/A'})
-                
-                # Check if account_tier is None (null in JSON) and set it to 'MISSING' if it is
-                account_tier = ticket['custom_fields'].get('account_tier')
-                if account_tier is None:
-                    account_tier = 'C'
-                    
-                # Check if environment is None (null in JSON) and set it to 'MISSING' if it is
-                environment = ticket['custom_fields'].get('environment')
-                if environment is None:
-                    environment = 'Production'
-                    
-                # Check if ticket_type is None (null in JSON) and set it to 'MISSING' if it is 
-                ticket_type = ticket['custom_fields'].get('ticket_type')
-                if ticket_type is None:
-                    ticket_type = 'Service request'    
-                    
-                # Check if the ticket is past due
-                is_past_due = check_past_due(ticket)
-                if is_past_due is None:    
-                    is_past_due = False 
+    if not ticket_count:
+        logging.warning("No tickets found.")
+    else:
+        logging.info("No more tickets to retrieve.")
 
-                escalated_value = ticket['custom_fields'].get('escalated')
-                if escalated_value == "Yes":
-                    escalated = True
-                elif escalated_value == "No" or escalated_value is None:
-                    escalated = False
-                    
-                # Filtering and transforming ticket data
-                filtered_ticket = {
-                    'id': ticket['id'],
-                    'subject': ticket['subject'],
-                    'group_name': groups.get(ticket['group_id'], '* Unassigned *'),
-                    'company_name': companies.get(ticket['department_id'], 'Unknown Company'),
-                    'priority': ticket['priority'],
-                    'status': ticket['status'],
-                    'created_at': ticket['created_at'],
-                    'updated_at': ticket['updated_at'],
-                    'fr_due_by': ticket['fr_due_by'],
-                    'due_by': ticket['due_by'],
-                    'is_past_due': is_past_due,
-                    'agent_name': agent_info['name'],
-                    'agent_email': agent_info['email'],
-                    'account_tier': account_tier,
-                    'environment': environment,
-                    'escalated': escalated,
-                    'ticket_type': ticket_type
-                }
+    logging.info('#' * 50)
+    logging.info("Total tickets retrieved: %s", ticket_count)
+    logging.info('#' * 50)
+    console_progress.done("Total tickets retrieved: %s in %s pages", ticket_count, page_count)
 
-                tickets.append(filtered_ticket)
+# Function to run the crawl as a pipeline: page fetch -> transform -> readable mapping -> scoring.
+# Each page is scored as one batch and its tickets are yielded before the next page is processed.
+def iter_scored_tickets(base_url, headers, agents, companies, groups, lookup_missing=None, statuses=OPEN_STATUSES):
+    for page_tickets in iter_ticket_pages(base_url, headers, statuses):
+        with STAGE_SECONDS.labels('transform').time():
+            transformed_tickets = [transform_ticket(ticket, agents, companies, groups, lookup_missing) for ticket in page_tickets]
+        with STAGE_SECONDS.labels('make_status_priority_readable').time():
+            readable_tickets = make_status_priority_readable(transformed_tickets)
+        with STAGE_SECONDS.labels('score').time():
+            score_tickets(readable_tickets)
+        yield from readable_tickets
 
-            logging.info(f"Page {page} of tickets retrieved. Count: {len(data['tickets'])}")
-            print(f"{datetime.now().strftime('%Y-%m-%d %H:%M:%S')} - Page {page} of tickets retrieved. Count: {len(data['tickets'])}")
+# Function to retrieve only the tickets updated since the given timestamp.
+# Returns the open tickets to merge and the tickets (id and updated_at only) that are no longer open.
+def get_updated_tickets(base_url, headers, updated_since, agents, companies, groups, lookup_missing=None):
+    updated_tickets = []
+    closed_tickets = []
+    logging.info("Retrieving tickets updated since %s from %s", updated_since, base_url)
 
-            # Check if the number of tickets is 99 or less and exit the loop if so
-            if len(data['tickets']) <= 99:
-                logging.info("Less than 100 tickets retrieved. No more tickets to retrieve.")
-                print(f"{datetime.now().strftime('%Y-%m-%d %H:%M:%S')} - No more tickets to retrieve.")
-                break
+    def fetch_page(page):
+        url = f"{base_url}/api/v2/tickets?updated_since={updated_since}&include=stats&per_page=100&page={page}"
+        logging.debug("Requesting page %s of updated tickets.", page)
+        data = get_json(url, headers, 'updated_ticket_page')
+        return data.get('tickets') or [], None
 
-            page += 1
-        else:
-            if page == 1:
-                logging.warning("No tickets found.")
-                print("No tickets found.")
+    for page_tickets in get_scheduler().fetch_pages(fetch_page):
+        for ticket in page_tickets:
+            if ticket['status'] in OPEN_STATUSES:
+                updated_tickets.append(transform_ticket(ticket, agents, companies, groups, lookup_missing))
             else:
-                logging.info("No more tickets to retrieve.")
-                print("No more tickets to retrieve.")
-            break
+                closed_tickets.append({'id': ticket['id'], 'updated_at': ticket['updated_at']})
 
-    logging.info('#' * 50)
-    logging.info(f"Total tickets retrieved: {len(tickets)}")
-    logging.info('#' * 50)
-    print(f"{datetime.now().strftime('%Y-%m-%d %H:%M:%S')} - Total tickets retrieved: {len(tickets)}")
-    return tickets
+    logging.info("Updated tickets retrieved: %s open, %s no longer open.", len(updated_tickets), len(closed_tickets))
+    console_progress.done("Updated tickets retrieved: %s open, %s no longer open.", len(updated_tickets), len(closed_tickets))
+    return updated_tickets, closed_tickets
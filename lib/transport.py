@@ -0,0 +1,132 @@
+################################################################################
+# transport.py is the single HTTP layer used to talk to FreshService.
+#
+# - Pooled keep-alive requests.Session shared by app.py and lib/tickets.py
+# - Cached authorization header, gzip and explicit timeouts
+# - Rate limit pacing and 429 Retry-After handling
+#
+# Author: Taylor Giddens - taylor.giddens@ingrammicro.com
+# Version: 1.0.3
+################################################################################
+import logging
+import sys
+import threading
+import time
+import requests
+from requests.adapters import HTTPAdapter
+from lib.scheduler import get_scheduler
+from lib import metrics
+
+DEFAULT_POOL_SIZE = 10
+DEFAULT_CONNECT_TIMEOUT = 5
+DEFAULT_READ_TIMEOUT = 30
+
+_session = None
+_session_lock = threading.Lock()
+_timeout = (DEFAULT_CONNECT_TIMEOUT, DEFAULT_READ_TIMEOUT)
+# Seconds each thread has spent waiting for rate limit tokens, so get_json can leave them out of its stage
+_rate_limit_waits = threading.local()
+
+
+# Function to (re)build the shared session. default_headers are sent with every request.
+def configure_transport(default_headers=None, pool_size=DEFAULT_POOL_SIZE,
+                        connect_timeout=DEFAULT_CONNECT_TIMEOUT, read_timeout=DEFAULT_READ_TIMEOUT):
+    global _session, _timeout
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    session.headers.update({'Accept-Encoding': 'gzip, deflate', 'Connection': 'keep-alive'})
+    if default_headers:
+        session.headers.update(default_headers)
+
+    with _session_lock:
+        if _session is not None:
+            _session.close()
+        _session = session
+        _timeout = (connect_timeout, read_timeout)
+    logging.info(f"HTTP transport configured. Pool size: {pool_size} Timeouts: {_timeout}")
+    return session
+
+def get_session():
+    with _session_lock:
+        session = _session
+    if session is None:
+        session = configure_transport()
+    return session
+
+# Function to work out how long to wait after a 429, using Retry-After when FreshService sends it
+def get_retry_after(response, attempt):
+    retry_after = response.headers.get('Retry-After')
+    try:
+        return max(float(retry_after), 1)
+    except (TypeError, ValueError):
+        return min(2 ** attempt, 60)
+
+# Function to handle API requests with retries for timeouts and rate limits, and handle specific error codes
+def make_api_request(method, url, headers=None, data=None, retries=2, rate_limit_retries=5):
+    bucket = get_scheduler().bucket
+    try:
+        waiting = time.perf_counter()
+        bucket.acquire()
+        waited = time.perf_counter() - waiting
+        metrics.STAGE_SECONDS.labels('rate_limit_wait').observe(waited)
+        _rate_limit_waits.seconds = getattr(_rate_limit_waits, 'seconds', 0.0) + waited
+        endpoint = metrics.endpoint_label(url)
+        started = time.perf_counter()
+        response = get_session().request(method, url, headers=headers, json=data, timeout=_timeout)
+        metrics.API_REQUEST_SECONDS.labels(endpoint).observe(time.perf_counter() - started)
+        metrics.API_REQUESTS.labels(endpoint, response.status_code).inc()
+        bucket.update_from_headers(response.headers)
+        if response.headers.get('X-Ratelimit-Remaining', '').isdigit():
+            metrics.RATELIMIT_REMAINING.set(int(response.headers['X-Ratelimit-Remaining']))
+        if response.status_code == 429:
+            metrics.API_RATE_LIMITED.inc()
+        if response.status_code == 429 and rate_limit_retries > 0:  # Back off and try again
+            metrics.API_RETRIES.labels('rate_limit').inc()
+            wait = get_retry_after(response, 5 - rate_limit_retries)
+            logging.warning(f"429 Too Many Requests. Pausing API requests for {wait:.0f}s. URL: {url}")
+            bucket.pause(wait)
+            return make_api_request(method, url, headers, data, retries, rate_limit_retries - 1)
+        elif response.status_code == 403:  # Handling 403 Forbidden Error
+            logging.error(f"403 Forbidden error encountered. URL: {url} Method: {method}")
+            print("It looks like FreshWorks doesn't like what you were doing and the user was locked.", file=sys.stderr)
+            print("Please check in FreshService that the user who your API KEY corresponds to is not locked.", file=sys.stderr)
+            print("https://support.cloudblue.com/agents", file=sys.stderr)
+        elif response.status_code == 401:  # Handling 401 Unauthorized Error
+            logging.error(f"401 Unauthorized error encountered. URL: {url} Method: {method}")
+            print("It looks like the API KEY you provided has a problem.", file=sys.stderr)
+            print("Follow these instructions to make sure you are getting the correct API KEY:", file=sys.stderr)
+            print("https://support.freshservice.com/en/support/solutions/articles/50000000306-where-do-i-find-my-api-key-", file=sys.stderr)
+            print("Once you have the correct API KEY, restart the application and enter the new value.", file=sys.stderr)
+        elif response.status_code == 429:  # Still rate limited after every retry
+            logging.error(f"429 Too Many Requests error encountered. URL: {url} Method: {method}")
+            print("It looks like you exceeded the API rate limit.", file=sys.stderr)
+            print("Go get a coffee, check your user isn't locked, and try again.", file=sys.stderr)
+        else:
+            logging.debug("API request successful. URL: %s Method: %s Status Code: %s", url, method, response.status_code)
+        response.raise_for_status()
+        return response
+    except requests.exceptions.Timeout:
+        if retries > 0:
+            logging.warning(f"Timeout encountered. Retrying... URL: {url}")
+            metrics.API_RETRIES.labels('timeout').inc()
+            time.sleep(2)
+            return make_api_request(method, url, headers, data, retries - 1, rate_limit_retries)
+        else:
+            logging.error(f"Maximum retries reached for timeout. URL: {url}")
+            raise
+    except requests.exceptions.RequestException as e:
+        logging.error(f"API request failed: {e}")
+        raise
+
+# Function to GET a URL and return its decoded JSON. The request and the decode are recorded under stage,
+# without the time spent waiting for rate limit tokens (recorded as rate_limit_wait), retries included.
+def get_json(url, headers=None, stage=None):
+    waited = getattr(_rate_limit_waits, 'seconds', 0.0)
+    started = time.perf_counter()
+    data = make_api_request("GET", url, headers).json()
+    if stage is not None:
+        waited = getattr(_rate_limit_waits, 'seconds', 0.0) - waited
+        metrics.STAGE_SECONDS.labels(stage).observe(time.perf_counter() - started - waited)
+    return data
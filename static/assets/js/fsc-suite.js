@@ -14,6 +14,8 @@ let isFetchAndUpdateRunning = false;
 let lastFetchAndUpdateTimestamp = null;
 let autoRefreshIntervalId = null;
 let autoRefreshInterval = 10 * 60 * 1000; // Default 10 minutes in milliseconds
+let lastTicketsVersion = null; // Snapshot version of the tickets currently in the table
+let ticketSummary = null; // Server-side counters for the tickets currently in the table
 
 const completionAudio = new Audio('/static/assets/music/100_percent.mp3');
 
@@ -48,8 +50,23 @@ function fetchAndUpdateTickets() {
     showStartToast();
 
     fetch('/tickets')
-        .then(response => response.json())
+        .then(response => {
+            // The server revalidates with an ETag, so an unchanged snapshot costs no download
+            const version = response.headers.get('X-Ticket-Version');
+            if (version !== null && version === lastTicketsVersion) {
+                return null; // Nothing changed since the last refresh
+            }
+            lastTicketsVersion = version;
+            // The counters come from the server, so the dashboard and filter menus need no table scans
+            return Promise.all([response.json(), fetchTicketSummary()]).then(([tickets]) => tickets);
+        })
         .then(tickets => {
+            if (tickets === null) {
+                console.log('Tickets unchanged, skipping table rebuild');
+                document.querySelector('#homeButton i').classList.remove('rotating');
+                showEndToast();
+                return;
+            }
             globalTickets = tickets;
             populateTable(tickets); // Update the table with new ticket data
 
@@ -71,6 +88,47 @@ function fetchAndUpdateTickets() {
     });
 }
 
+// Function to fetch the server-side counters and filter values for the current tickets
+function fetchTicketSummary() {
+    return fetch('/tickets/summary')
+        .then(response => response.ok ? response.json() : null)
+        .then(summary => {
+            ticketSummary = summary;
+        })
+        .catch(error => {
+            console.error('Error fetching ticket summary:', error);
+            ticketSummary = null;
+        });
+}
+
+// Function to return the summary if it matches the tickets in the table
+function currentTicketSummary() {
+    if (ticketSummary === null || String(ticketSummary.version) !== lastTicketsVersion) {
+        return null;
+    }
+    return ticketSummary;
+}
+
+// Function to listen for ticket updates pushed by the server
+function startTicketStream() {
+    if (!window.EventSource) {
+        console.log('Server-Sent Events not supported, relying on auto-refresh');
+        return;
+    }
+    const ticketStream = new EventSource('/tickets/stream');
+    const handleTicketEvent = (event) => {
+        const data = JSON.parse(event.data);
+        // Only reload when the table is behind and the user has not paused auto-refresh
+        if (String(data.version) !== lastTicketsVersion && document.getElementById('toggleAutoRefresh').checked) {
+            console.log(`Ticket stream reported version ${data.version}, refreshing`);
+            fetchAndUpdateTickets();
+        }
+    };
+    ticketStream.addEventListener('version', handleTicketEvent);
+    ticketStream.addEventListener('tickets', handleTicketEvent);
+    ticketStream.onerror = () => console.log('Ticket stream disconnected, the browser will reconnect');
+}
+
 // Check if the refresh interval has elapsed
 function isRefreshIntervalElapsed() {
     if (!lastFetchAndUpdateTimestamp) return true;
@@ -321,12 +379,21 @@ function evaluateReadStatus(tickets) {
 // Function to update dashboard counts & progress bar
 const updateDashboardCounts = () => {
     const rows = document.querySelectorAll('#ticketsTable tbody tr:not([style*="display: none"])');
+    const summary = currentTicketSummary();
+    const isUnfiltered = document.getElementById('filterCategory').value === 'all' && document.getElementById('focusFilter').value !== 'focused';
 
-    const totalTickets = rows.length;
-    const totalIncidents = Array.from(rows).filter(row => row.cells[7].textContent.trim() === 'Incident or Problem').length;
-    const totalServiceRequests = Array.from(rows).filter(row => row.cells[7].textContent.trim() === 'Service request').length;
-    const totalEscalated = Array.from(rows).filter(row => row.cells[9].textContent.trim().includes('Yes')).length;
-    const totalOverdue = Array.from(rows).filter(row => row.cells[10].textContent.trim().includes('Yes')).length;
+    let totalTickets, totalIncidents, totalServiceRequests, totalEscalated, totalOverdue;
+    if (summary && isUnfiltered) {
+        // Every row is shown, so the server-side counters match the table
+        ({ total: totalTickets, incidents: totalIncidents, service_requests: totalServiceRequests, escalated: totalEscalated, overdue: totalOverdue } = summary);
+    } else {
+        totalTickets = rows.length;
+        totalIncidents = Array.from(rows).filter(row => row.cells[7].textContent.trim() === 'Incident or Problem').length;
+        totalServiceRequests = Array.from(rows).filter(row => row.cells[7].textContent.trim() === 'Service request').length;
+        totalEscalated = Array.from(rows).filter(row => row.cells[9].textContent.trim().includes('Yes')).length;
+        totalOverdue = Array.from(rows).filter(row => row.cells[10].textContent.trim().includes('Yes')).length;
+    }
+    // Read marks only exist in this browser, so done is still counted from the table
     const totalDone = Array.from(rows).filter(row => {
         const status = row.cells[6].textContent.trim(); // Ticket status in column 8
         const cellIconHTML = row.cells[0].innerHTML; // Read status icon in column 1
@@ -491,47 +558,54 @@ const updateFilterValueDropdown = (callback) => {
     filterValueDropdown.innerHTML = '';
     let options = [];
     let counts = {};
+    const summary = currentTicketSummary();
 
-    // Count the occurrences of each option
-    rows.forEach(row => {
-        let value;
-        switch (filterCategory) {
-            case 'company':
-                value = row.cells[2].textContent.trim();
-                break;
-            case 'group':
-            case 'agent':
-                value = row.cells[filterCategory === 'group' ? 15 : 14].textContent.trim() || '* Unassigned *';
-                break;
-            case 'tier':
-                value = row.cells[3].textContent.trim();
-                break;
-            case 'priority':
-                value = row.cells[5].textContent.trim();
-                break;
-            case 'status':
-                value = row.cells[6].textContent.trim();
-                break;
-            case 'type':
-                value = row.cells[7].textContent.trim();
-                break;
-            case 'environment':
-                value = row.cells[8].textContent.trim();
-                break;
-            case 'escalated':
-            case 'overdue':
-                value = row.cells[filterCategory === 'escalated' ? 9 : 10].textContent.trim().includes('Yes') ? 'Yes' : 'No';
-                break;
-            default:
-                value = ''; // Default case to catch any unforeseen categories
-                break;
-        }
+    if (summary && summary.filters[filterCategory]) {
+        // Use the counts kept by the server instead of scanning the table
+        counts = { ...summary.filters[filterCategory] };
+        options = Object.keys(counts);
+    } else {
+        // Count the occurrences of each option
+        rows.forEach(row => {
+            let value;
+            switch (filterCategory) {
+                case 'company':
+                    value = row.cells[2].textContent.trim();
+                    break;
+                case 'group':
+                case 'agent':
+                    value = row.cells[filterCategory === 'group' ? 15 : 14].textContent.trim() || '* Unassigned *';
+                    break;
+                case 'tier':
+                    value = row.cells[3].textContent.trim();
+                    break;
+                case 'priority':
+                    value = row.cells[5].textContent.trim();
+                    break;
+                case 'status':
+                    value = row.cells[6].textContent.trim();
+                    break;
+                case 'type':
+                    value = row.cells[7].textContent.trim();
+                    break;
+                case 'environment':
+                    value = row.cells[8].textContent.trim();
+                    break;
+                case 'escalated':
+                case 'overdue':
+                    value = row.cells[filterCategory === 'escalated' ? 9 : 10].textContent.trim().includes('Yes') ? 'Yes' : 'No';
+                    break;
+                default:
+                    value = ''; // Default case to catch any unforeseen categories
+                    break;
+            }
 
-        if (!options.includes(value)) {
-            options.push(value);
-        }
-        counts[value] = (counts[value] || 0) + 1;
-    });
+            if (!options.includes(value)) {
+                options.push(value);
+            }
+            counts[value] = (counts[value] || 0) + 1;
+        });
+    }
 
     // Sort options and ensure '* Unassigned *' is at the top for 'group' and 'agent'
     if (filterCategory === 'group' || filterCategory === 'agent') {
@@ -919,6 +993,7 @@ document.getElementById('focusFilter').addEventListener('change', () => {
 window.addEventListener('DOMContentLoaded', (event) => {
     applySettings();
     fetchAndUpdateTickets(); // Fetch tickets immediately on load
+    startTicketStream(); // Pick up server-side changes as they happen
 
     if (document.getElementById('toggleAutoRefresh').checked) {
         startAutoRefresh(); // Start auto-refresh if enabled
@@ -0,0 +1,47 @@
+import time
+from lib.deadlines import DeadlineScheduler
+from lib.sync import format_timestamp
+from lib.tickets import transform_ticket
+
+
+def make_raw_ticket(fr_due_by, fr_escalated, first_responded_at=None):
+    ticket = {
+        'id': 1, 'subject': 'Ticket', 'group_id': None, 'department_id': None, 'responder_id': None,
+        'priority': 2, 'status': 2, 'created_at': format_timestamp(time.time() - 86400),
+        'updated_at': format_timestamp(time.time() - 3600), 'fr_due_by': fr_due_by,
+        'due_by': format_timestamp(time.time() + 86400), 'fr_escalated': fr_escalated,
+        'custom_fields': {},
+    }
+    if first_responded_at is not None:
+        ticket['stats'] = {'first_responded_at': first_responded_at}
+    return ticket
+
+
+def transform(ticket):
+    return transform_ticket(ticket, {}, {}, {})
+
+
+def tracked_deadlines(ticket):
+    scheduler = DeadlineScheduler(lambda due: None)
+    scheduler.track([ticket])
+    return set(scheduler._deadlines)
+
+
+def test_answered_ticket_is_not_past_its_first_response_deadline():
+    passed = format_timestamp(time.time() - 7200)
+    answered = transform(make_raw_ticket(passed, False))
+    answered_late = transform(make_raw_ticket(passed, True, format_timestamp(time.time() - 3600)))
+    for ticket in (answered, answered_late):
+        assert ticket['fr_responded'] is True
+        assert ticket['is_fr_past_due'] is False
+        assert tracked_deadlines(ticket) == {(1, 'due_by')}
+
+
+def test_unanswered_ticket_breaches_its_first_response_deadline():
+    breached = transform(make_raw_ticket(format_timestamp(time.time() - 7200), True))
+    assert breached['fr_responded'] is False
+    assert breached['is_fr_past_due'] is True
+
+    upcoming = transform(make_raw_ticket(format_timestamp(time.time() + 7200), False))
+    assert upcoming['is_fr_past_due'] is False
+    assert tracked_deadlines(upcoming) == {(1, 'due_by'), (1, 'fr_due_by')}
@@ -0,0 +1,41 @@
+import threading
+from lib.profiling import RefreshProfiler
+
+
+def test_profile_started_while_another_runs_is_skipped(tmp_path):
+    profiler = RefreshProfiler(tmp_path, sample_interval=0.001)
+    started = threading.Event()
+    finish = threading.Event()
+    results = {}
+
+    def background_refresh():
+        with profiler.profile('background') as result:
+            started.set()
+            finish.wait(5)
+        results['background'] = result
+
+    thread = threading.Thread(target=background_refresh)
+    thread.start()
+    started.wait(5)
+    with profiler.profile('request') as result:
+        pass
+    finish.set()
+    thread.join()
+
+    assert result.pstats_path is None
+    assert results['background'].pstats_path.exists()
+    assert not [thread for thread in threading.enumerate() if thread.name == 'profile-sampler']
+
+    # The next profile on either thread runs normally
+    with profiler.profile('after') as result:
+        sum(range(1000))
+    assert result.pstats_path.exists()
+
+
+def test_nested_profile_is_folded_into_the_outer_one(tmp_path):
+    profiler = RefreshProfiler(tmp_path)
+    with profiler.profile('outer') as outer:
+        with profiler.profile('inner') as inner:
+            pass
+    assert inner.pstats_path is None
+    assert outer.pstats_path.exists()
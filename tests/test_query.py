@@ -0,0 +1,8 @@
+import pytest
+from werkzeug.datastructures import MultiDict
+from lib.query import QueryError, parse_ticket_query
+
+
+def test_bad_boolean_names_the_query_parameter():
+    with pytest.raises(QueryError, match="for overdue"):
+        parse_ticket_query(MultiDict([('overdue', 'maybe')]))
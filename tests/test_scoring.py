@@ -0,0 +1,78 @@
+import logging
+import random
+from itertools import product
+import pytest
+import lib.scoring
+from lib.fake_freshservice import FakeData
+from lib.priority_index import PriorityIndex
+from lib.tickets import SCORING_ENGINE, SCORING_MAP, make_ticket_readable, transform_ticket
+
+
+# Frozen copy of the per-ticket scoring the engine replaced. Do not change it, it is the reference.
+def calculate_sort_key(ticket):
+    account_tier = ticket.get('account_tier', 'C')
+    environment = ticket.get('environment', 'Production')
+    priority = ticket.get('priority', 'Urgent')
+    ticket_type = ticket.get('ticket_type', 'Incident or Problem')
+    escalated = ticket.get('escalated', False)
+
+    if account_tier == 'MISSING':
+        logging.warning(f"Ticket ID: {ticket['id']} has 'MISSING' account tier. Handling as per logic.")
+
+    if escalated:
+        score_key = (account_tier, 'escalated', environment)
+    else:
+        score_key = (account_tier, priority, environment, ticket_type)
+
+    score = SCORING_MAP.get(score_key, 0)
+    return (-score, ticket['created_at'])
+
+
+# Every combination of known and unknown values, plus tickets with fields missing
+def make_combination_tickets():
+    tiers = sorted({key[0] for key in SCORING_MAP}) + ['MISSING', 'Z']
+    priorities = sorted({key[1] for key in SCORING_MAP if len(key) == 4}) + ['Unknown']
+    environments = sorted({key[2] for key in SCORING_MAP}) + ['Nowhere']
+    ticket_types = sorted({key[3] for key in SCORING_MAP if len(key) == 4}) + ['Other']
+    randomizer = random.Random(11)
+    tickets = []
+    for tier, priority, environment, ticket_type, escalated in product(tiers, priorities, environments, ticket_types, (False, True)):
+        tickets.append({
+            'id': len(tickets) + 1, 'account_tier': tier, 'priority': priority, 'environment': environment,
+            'ticket_type': ticket_type, 'escalated': escalated,
+            'created_at': f"2024-{randomizer.randint(1, 12):02d}-{randomizer.randint(1, 28):02d}T10:00:00Z",
+        })
+    for missing in ('account_tier', 'priority', 'environment', 'ticket_type', 'escalated'):
+        ticket = dict(tickets[0], id=len(tickets) + 1)
+        del ticket[missing]
+        tickets.append(ticket)
+    return tickets
+
+
+def make_fake_tickets():
+    data = FakeData(tickets=2000)
+    return [make_ticket_readable(transform_ticket(ticket, {}, {}, {})) for ticket in data.tickets]
+
+
+@pytest.fixture(params=['numpy', 'python'])
+def backend(request, monkeypatch):
+    if request.param == 'numpy':
+        if lib.scoring.np is None:
+            pytest.skip('NumPy is not installed')
+    else:
+        monkeypatch.setattr(lib.scoring, 'np', None)
+    return request.param
+
+
+@pytest.mark.parametrize('make_tickets', [make_combination_tickets, make_fake_tickets])
+def test_engine_matches_the_per_ticket_scores_and_order(backend, make_tickets):
+    tickets = make_tickets()
+    expected_scores = [-calculate_sort_key(ticket)[0] for ticket in tickets]
+    # The old order: a stable sort on the sort key, over tickets listed by ID
+    expected_order = [ticket['id'] for ticket in sorted(tickets, key=calculate_sort_key)]
+
+    scores = SCORING_ENGINE.score(tickets)
+    assert scores == expected_scores
+    for ticket, score in zip(tickets, scores):
+        ticket['score'] = score
+    assert list(PriorityIndex(tickets)) == expected_order
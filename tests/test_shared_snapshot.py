@@ -0,0 +1,54 @@
+import gzip
+import json
+from lib.bodies import response_body
+from lib.records import TicketRecord
+from lib.shared_snapshot import SharedTicketSnapshot
+
+
+def make_tickets(count, score=10):
+    return [TicketRecord(id=ticket_id, subject=f"Ticket {ticket_id}", created_at='2024-01-01T00:00:00Z', score=score)
+            for ticket_id in range(count)]
+
+
+def make_pair(tmp_path):
+    path = tmp_path / 'tickets.snapshot'
+    fetcher = SharedTicketSnapshot(None, 60, path)
+    assert fetcher.election.try_acquire()
+    reader = SharedTicketSnapshot(None, 60, path)
+    assert not reader.election.try_acquire()
+    return fetcher, reader
+
+
+def test_reader_serves_the_mapped_body_without_decoding(tmp_path):
+    fetcher, reader = make_pair(tmp_path)
+    fetcher.publish(make_tickets(3))
+    assert reader.sync_from_file()
+
+    body = reader.encoded_body(reader.version).identity
+    assert isinstance(body, memoryview)
+    assert b''.join(response_body(body, chunk_size=16)) == fetcher.body.identity
+    assert len(reader.tickets) == 3
+    assert reader.tickets._tickets is None
+    assert json.loads(gzip.decompress(reader.body.get('gzip'))) == json.loads(fetcher.body.identity)
+
+
+def test_reader_decodes_the_tickets_when_they_are_read(tmp_path):
+    fetcher, reader = make_pair(tmp_path)
+    fetcher.publish(make_tickets(3))
+    reader.sync_from_file()
+    assert [ticket['id'] for ticket in reader.tickets] == [0, 1, 2]
+    assert reader.tickets[1] == fetcher.tickets[1]
+
+
+def test_new_version_is_mapped_while_the_old_body_is_in_use(tmp_path):
+    fetcher, reader = make_pair(tmp_path)
+    fetcher.publish(make_tickets(3))
+    reader.sync_from_file()
+    old_body = reader.body.identity
+
+    fetcher.publish(make_tickets(5, score=20))
+    assert reader.sync_from_file()
+    assert (reader.version, reader.etag) == (fetcher.version, fetcher.etag)
+    assert len(reader.tickets) == 5
+    assert bytes(old_body) != bytes(reader.body.identity)
+    assert reader.changes_since(reader.version - 1)[1]['changed']
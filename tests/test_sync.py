@@ -0,0 +1,35 @@
+import time
+from lib.records import TicketRecord
+from lib.sync import CLOCK_SKEW_MARGIN, TicketSync, format_timestamp
+
+
+def make_ticket(ticket_id, updated_at, score=10):
+    return TicketRecord(id=ticket_id, created_at='2024-01-01T00:00:00Z', updated_at=updated_at, score=score,
+                        status='Open', priority='Medium', ticket_type='Incident or Problem')
+
+
+# A ticket read on an early page and updated before a later page is read must still be in the next window
+def test_ticket_updated_mid_crawl_is_fetched_by_the_next_incremental_sync():
+    started_at = time.time() - 60
+    early = make_ticket(1, format_timestamp(started_at - 3600))
+    late = make_ticket(2, format_timestamp(started_at + 30))
+    sync = TicketSync(full_sync_interval=3600)
+    sync.replace([early, late], started_at)
+
+    updated_mid_crawl = format_timestamp(started_at + 10)
+    assert updated_mid_crawl >= sync.watermark
+    assert sync.watermark == format_timestamp(started_at - CLOCK_SKEW_MARGIN)
+
+    sync.merge([make_ticket(1, updated_mid_crawl, score=50)], [], time.time())
+    assert sync.ordered()[0]['score'] == 50
+    assert sync.watermark <= updated_mid_crawl
+
+
+def test_watermark_is_the_newest_update_when_it_is_older_than_the_crawl():
+    started_at = time.time()
+    sync = TicketSync(full_sync_interval=3600)
+    sync.replace([make_ticket(1, '2024-01-02T00:00:00Z'), make_ticket(2, '2024-01-03T00:00:00Z')], started_at)
+    assert sync.watermark == '2024-01-03T00:00:00Z'
+
+    sync.merge([], [], started_at + 60)
+    assert sync.watermark == '2024-01-03T00:00:00Z'
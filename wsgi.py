@@ -0,0 +1,30 @@
+################################################################################
+# wsgi.py runs FSC Suite under a WSGI server with several worker processes.
+#
+# - API key from the FSC_API_KEY environment variable
+# - Command line options from FSC_ARGS, e.g. FSC_ARGS="--mode staging -r 120"
+# - Workers share one snapshot file, so only one of them crawls FreshService
+#
+# Example:
+#   FSC_API_KEY=... gunicorn --workers 4 --threads 8 --bind 127.0.0.1:5000 wsgi:app
+#
+# Do not use --preload, the refresher threads have to start in each worker.
+#
+# Author: Taylor Giddens - taylor.giddens@ingrammicro.com
+# Version: 1.0.3
+################################################################################
+import os
+import shlex
+from pathlib import Path
+
+import app as fsc_app
+
+args = fsc_app.parse_arguments(shlex.split(os.environ.get('FSC_ARGS', '')))
+if not args.shared_snapshot:
+    args.shared_snapshot = str(Path(fsc_app.CACHE_DIRECTORY).resolve() / f"fsc_{args.mode}.snapshot")
+
+# Each worker logs to its own file, rotating one file from several processes would race
+fsc_app.setup_logging(args, f"{fsc_app.SCRIPT_NAME}.{os.getpid()}.log")
+fsc_app.get_ticket_snapshot(args)
+
+app = fsc_app.app